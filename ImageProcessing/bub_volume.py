@@ -4,7 +4,14 @@
 Dev: 	adejonghm
 ----------
 
-
+Volume of the bubbles of a node, from the masks saved by image_segmentation.py
+in the mask store of the node (dsip.masks), or from its binary images (named
+<frame>-<bubble>.jpg) when there is no store. The frames of each bubble are
+taken from the index of the bubbles saved with the masks. The volume of the
+first image of each bubble is saved as before, together with the volumes and
+radii of every frame of every bubble. When the segmentation saved the
+trajectories of the bubbles, the rise velocity and the Reynolds number of every
+tracked bubble are saved too.
 """
 
 # Standard library imports
@@ -18,6 +25,9 @@ import numpy as np
 
 # Local application imports
 from dsip import improc as dip
+from dsip import sigproc as dsp
+from dsip.masks import INDEX_FILE, MASKS_FILE, MaskStore, load_index
+from dsip.tracking import TRACKS_FILE, load_tracks
 # from dsip.gfd import generic_fourier_descriptor
 
 
@@ -27,6 +37,8 @@ if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("-f", "--file", required=True,
                     help="path to the input JSON file")
+    ap.add_argument("-s", "--subpixel", action='store_true',
+                    help="measure the width of the contour instead of counting pixels")
     args = vars(ap.parse_args())
     input_path = ''
 
@@ -51,33 +63,52 @@ if __name__ == "__main__":
     diameter = node['diameter']
     bubbles_number = len(node['bubblesStart'])
     bw_frames_path = node_path + node['bwFramesPath']
-    images_list = sorted(os.listdir(bw_frames_path))
-    first_images = []
+    masks_path = node_path + MASKS_FILE
+    index_path = node_path + INDEX_FILE
+    tracks_path = node_path + TRACKS_FILE
+    scale_factor = 0.3846
+    sequences = {}
     volumes = []
     radii = []
+    frames_volumes = []
+    frames_radii = []
     data = {}
 
-    # Looking for the first image of each sequence.
-    for i in range(bubbles_number):
-        for k, name in enumerate(images_list):
-            number, _ = name.split("-")
-            if int(number) == i + 1:
-                first_images.append(name)
-                break
-
-    for i, name in enumerate(first_images):
-        short_name_frame = name.split('.')[0].split('-')[1]
-
-        #### LOADING IMAGE ####
-        frame = cv.imread(bw_frames_path + name, 0)
-        _, bw_image = cv.threshold(frame, 200, 255, cv.THRESH_BINARY)
-
-        #### VOLUME CALCULATION ####
-        vol = dip.get_bubble_volume(bw_image, 0.3846)
-        radius = pow((3 * vol) / (4 * np.pi), 1/3)
-
-        volumes.append(round(vol, 2))
-        radii.append(round(radius, 2))
+    # Masks of the store, or images of each bubble in the order of the frames.
+    store = MaskStore(masks_path) if os.path.exists(masks_path) else None
+    if store is not None:
+        sequences = store.index
+    elif os.path.exists(index_path):
+        for i, entry in load_index(index_path).items():
+            sequences[i] = ['{}-{}.jpg'.format(name, i) for name in entry['names']]
+    else:
+        for name in sorted(os.listdir(bw_frames_path)):
+            _, number = name.split('.')[0].split('-')
+            sequences.setdefault(int(number), []).append(name)
+
+    for i in range(1, bubbles_number + 1):
+        if i not in sequences:
+            continue
+
+        #### LOADING MASKS ####
+        if store is not None:
+            (_, masks) = store.masks(i)
+            if args['subpixel']:
+                masks = masks.astype(np.uint8) * 255
+        else:
+            frames = np.stack([cv.imread(bw_frames_path + name, 0) for name in sequences[i]])
+            if args['subpixel']:
+                masks = frames
+            else:
+                masks = frames > 200
+
+        #### VOLUME CALCULATION OF ALL THE FRAMES ####
+        (vols, rads) = dip.get_bubble_volumes(masks, scale_factor, args['subpixel'])
+
+        volumes.append(round(float(vols[0]), 2))
+        radii.append(round(float(rads[0]), 2))
+        frames_volumes.append(np.round(vols, 2).tolist())
+        frames_radii.append(np.round(rads, 2).tolist())
 
         ### FOURIER DESCRIPTORS & CENTROID ####
         # square_image = dip.center_bubble(bw_image)
@@ -103,6 +134,30 @@ if __name__ == "__main__":
     data['diameter'] = diameter
     data['volumes'] = volumes
     data['radii_from_images'] = radii
+    data['frames_volumes'] = frames_volumes
+    data['frames_radii'] = frames_radii
+
+    # REYNOLDS NUMBERS OF THE TRACKED BUBBLES, WITH THE RADIUS OF THE CIRCLE OF
+    # THEIR MEAN AREA AND THEIR RISE VELOCITY IN PX/S
+    tracks = load_tracks(tracks_path) if os.path.exists(tracks_path) else None
+    if tracks is not None and np.isnan(tracks.get('fps', np.nan)):
+        print('WARNING! The fps of the tracks is unknown, their velocities are in px/frame. '
+              'The Reynolds numbers are not calculated (segment again with --fps).')
+    elif tracks is not None:
+        counts = np.diff(tracks['offsets'])
+        mean_areas = np.zeros(len(counts))
+        if len(counts):
+            mean_areas = np.add.reduceat(tracks['areas'], tracks['offsets'][:-1]) / counts
+        tracks_radii = np.sqrt(mean_areas / np.pi) * scale_factor
+        reynolds = dsp.get_reynolds(tracks_radii * 1e-3, tracks['rise_velocities'], scale_factor)
+
+        data['tracks'] = {
+            'ids': tracks['ids'].tolist(),
+            'spans': tracks['spans'].tolist(),
+            'radii': np.round(tracks_radii, 2).tolist(),
+            'rise_velocities': np.round(tracks['rise_velocities'] * scale_factor, 2).tolist(),
+            'reynolds': np.round(reynolds, 3).tolist()
+        }
 
     with open(volumes_radii_file, 'w', encoding='utf-8') as file:
         json.dump(data, file, indent=2, separators=(',', ':'))
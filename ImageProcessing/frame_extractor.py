@@ -8,6 +8,8 @@ Dev: 	adejonghm
 Script to separate a video frame by frame. It's necessary to provide
 the input path as parameter and you could provide the output path as
 parameter too. By default create the output folder in the script folder.
+With --store, the frames are saved in grayscale in a frame store (dsip.frames)
+instead of JPEG images.
 """
 
 
@@ -18,6 +20,9 @@ from os import sys, makedirs
 # Third party imports
 import cv2 as cv
 
+# Local application imports
+from dsip.frames import write_frame_store
+
 
 def get_info(videofile):
     """[summary]
@@ -42,10 +47,11 @@ def get_info(videofile):
 
 if __name__ == '__main__':
 
-    args = sys.argv
+    store = '--store' in sys.argv
+    args = [arg for arg in sys.argv if arg != '--store']
     if len(args) < 3:
         print('Missing arguments! Expected 2 argumens and receive {}.\n'
-              'Example:\n  {} <input_path> <output_path>'.
+              'Example:\n  {} <input_path> <output_path> [--store]'.
               format(len(args) - 1, args[0]))
         sys.exit(1)
 
@@ -60,6 +66,12 @@ if __name__ == '__main__':
         print("Invalid Video Format! Valid formats {}".format(formtas))
         sys.exit(1)
 
+    # ****** Writing a frame store ******
+    if store:
+        video.release()
+        print('DONE! {} frames saved in the store'.format(write_frame_store(input_path, output_path)))
+        sys.exit(0)
+
     # ****** Creating output folder ******
     makedirs(output_path, exist_ok=True)
 
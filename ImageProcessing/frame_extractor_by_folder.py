@@ -17,12 +17,16 @@ import shutil
 # Third party imports
 import cv2 as cv
 
+# Local application imports
+from dsip.frames import FrameStoreWriter, VideoFrames
 
-def separate(in_path, out_path):
+
+def separate(in_path, out_path, store=False):
     """
     Arguments:
         in_path {[type]} -- [description]
         out_path {[type]} -- [description]
+        store {bool} -- save the frames in grayscale in a frame store (dsip.frames)
     """
     vid = cv.VideoCapture(in_path)
     number_frames = int(vid.get(cv.CAP_PROP_FRAME_COUNT))
@@ -33,6 +37,15 @@ def separate(in_path, out_path):
         time = number_frames // fps
         length = time * fps
 
+    # ****** Writing a frame store ******
+    if store:
+        vid.release()
+        frames = VideoFrames(in_path, gray=True, stop=length)
+        with FrameStoreWriter(out_path, frames.fps, source=os.path.abspath(in_path)) as writer:
+            for i, frame in frames:
+                writer.append(frame, i / frames.fps)
+        return
+
     for i in range(length):
         factor = len(str(length))
 
@@ -64,10 +77,13 @@ def separate(in_path, out_path):
 if __name__ == '__main__':
 
     # ****** Loading video ******
+    to_store = '--store' in os.sys.argv
+    if to_store:
+        os.sys.argv.remove('--store')
     args = len(os.sys.argv)
     if args < 3:
         print('Missing arguments! Expected 2 argumens and receive {}.'
-              'Example:\n  {} <input_path> <output_path>'.
+              'Example:\n  {} <input_path> <output_path> [--store]'.
               format(args-1, os.sys.argv[0]))
         os.sys.exit(1)
 
@@ -106,5 +122,5 @@ if __name__ == '__main__':
             temporal_path = output_path + NAME
             os.makedirs(temporal_path)
             video = input_path + filenames[index] + '.avi'
-            separate(video, temporal_path)
+            separate(video, temporal_path, to_store)
             index += 1
@@ -5,22 +5,217 @@ Created on:	 April, 2020
 @uthor: 	 adejonghm
 ----------
 
+Segmentation of the bubbles in the frames of a node with DRLSE, in two phases.
+The first one (background subtraction -> cleaning -> DRLSE -> binarization)
+is independent for each frame and runs in a pool of processes with --jobs.
+The second one goes through the frames in order, selecting the main bubble
+and numbering the bubbles, and saves their masks in the mask store of the node
+(dsip.masks), with the index of the frames of each bubble, and also as JPEG
+images with --jpeg. All the objects of the frames are followed by a tracker
+(dsip.tracking), and their trajectories and velocities are saved too.
 """
 
 # Standard library imports
 import argparse
 import json
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 # Third party imports
 import cv2 as cv
-import matplotlib.pyplot as plt
 import numpy as np
+from scipy import ndimage
 # from tqdm import tqdm
 
 # Local application imports
 from dsip import improc as dip
-from dsip.drlse import drlse_edge
+from dsip.drlse import DRLSE, shift_level_set
+from dsip.frames import open_frames
+from dsip.masks import INDEX_FILE, MASKS_FILE, MaskStoreWriter, write_index
+from dsip.tracking import TRACKS_FILE, BubbleTracker, save_tracks
+
+
+# Background, parameters and DRLSE engine of the process, set by `init_worker`
+WORKER = {}
+
+
+def init_worker(backg: np.ndarray, params: dict):
+    """Keep the background and the parameters of the segmentation in the process.
+    The DRLSE engine is created with the first frame that has a bubble.
+
+    Args:
+        backg (np.ndarray): Background image, cropped as the frames.
+        params (dict): Parameters of the segmentation.
+    """
+
+    WORKER['backg'] = backg
+    WORKER['params'] = params
+    WORKER['subtracted'] = np.empty_like(backg)
+    WORKER['engine'] = None
+
+
+def segment_frame(frame: np.ndarray, init: np.ndarray = None) -> tuple:
+    """Remove the background of a frame, clean it and find the bubbles with DRLSE.
+    Only the flow area grown by a margin (the region of interest) is processed.
+
+    Args:
+        frame (np.ndarray): Grayscale frame, cropped to the region of interest.
+        init (np.ndarray, optional): Initial level set function. Defaults to the box.
+
+    Returns:
+        tuple: The final level set function, the binary image of the region of interest
+               and the outer loops done, or (None, None, 0) when there is no bubble.
+    """
+
+    params = WORKER['params']
+
+    ## REMOVIMG BACKGROUND IN THE FLOW AREA ##
+    img = dip.subtract(frame, WORKER['backg'], thresh=15, out=WORKER['subtracted'])
+
+    ## SMOOTHING IMAGE BY GAUSSIAN CONVOLUTION ##
+    smoothed_img = dip.clean_image(img, params['roi_coord'], params['sigma'])
+
+    if not np.count_nonzero(smoothed_img):
+        return (None, None, 0)
+
+    ## CALCULATE GRADIENT & DEFINE EDGE INDICATOR FUNCTION ##
+    [Iy, Ix] = np.gradient(smoothed_img)
+    f = np.square(Ix) + np.square(Iy)
+    edge_indicator_function = 1 / (1 + f)
+
+    if WORKER['engine'] is None:
+        WORKER['engine'] = DRLSE(smoothed_img.shape, params['lmda'], params['mu'],
+                                 params['epsilon'], params['timestep'],
+                                 params['potential_function'], params['alpha'],
+                                 dtype=params['dtype'], band=params['band'])
+    engine = WORKER['engine']
+    engine.set_edge_indicator(edge_indicator_function)
+
+    c = params['c']
+    if init is not None:
+        phi = init
+    else:
+        ## INITIALIZE LSF AS BINARY STEP FUNCTION & GENERATE THE INITIAL REGION R0 ##
+        init_LSF = c * np.ones(params['img_shape'], dtype=params['dtype'])
+        init_LSF[1:-5, 140:215] = -c
+        phi = init_LSF[params['roi']].copy()
+
+    ## START LEVEL SET EVOLUTION UNTIL THE CONTOUR STOPS MOVING ##
+    (phi, outer_loops) = engine.run(phi, params['iter_inner'], params['iter_outer'],
+                                    params['tolerance'])
+
+    ## REFINE THE ZERO LEVEL CONTOUR BY FURTHER LEVEL SET EVOLUTION WITH (alpha=0) ##
+    phi = engine.evolve(phi, params['iter_refine'], alpha=0)
+
+    ## BINARIZE IMAGE ##
+    (_, bw_image) = cv.threshold(phi, 0, 255, cv.THRESH_BINARY_INV)
+
+    return (phi, bw_image, outer_loops)
+
+
+def segment_binary(frame: np.ndarray) -> tuple:
+    """Segment a frame in a worker process, without returning its level set function.
+
+    Args:
+        frame (np.ndarray): Grayscale frame, cropped to the region of interest.
+
+    Returns:
+        tuple: None, the binary image and the outer loops done.
+    """
+
+    (_, bw_image, outer_loops) = segment_frame(frame)
+
+    return (None, bw_image, outer_loops)
+
+
+def segment_parallel(executor: ProcessPoolExecutor, frames, ahead: int):
+    """Segment the frames in a pool of processes, keeping a bounded number of them
+    in flight, and give the results in the order of the frames.
+
+    Args:
+        executor (ProcessPoolExecutor): Pool of processes started with `init_worker`.
+        frames (iterable): Pairs (name, frame) of the frames.
+        ahead (int): Maximum number of frames submitted and not yet given.
+
+    Yields:
+        tuple: The name of each frame and the result of `segment_binary`.
+    """
+
+    pending = deque()
+    for name, frame in frames:
+        pending.append((name, executor.submit(segment_binary, frame)))
+        if len(pending) >= ahead:
+            name, future = pending.popleft()
+            yield (name, future.result())
+
+    while pending:
+        name, future = pending.popleft()
+        yield (name, future.result())
+
+
+def lost_by_warm_start(phi: np.ndarray, start: np.ndarray, previous: np.ndarray,
+                       area_change: float) -> bool:
+    """Decide if the warm start may have cut the bubble: its region reaches the border
+    of the initial region, so the bubble may go beyond it, or its area changed more
+    than a fraction of the area in the previous frame.
+
+    Args:
+        phi (np.ndarray): Level set function found from the warm start.
+        start (np.ndarray): Initial region (boolean) of the warm start.
+        previous (np.ndarray): Level set function of the previous frame.
+        area_change (float): Allowed change of the area, as a fraction.
+
+    Returns:
+        bool: True when the frame must be segmented again from the box.
+    """
+
+    region = phi < 0
+    border = start & ~ndimage.binary_erosion(start, border_value=1)
+    if np.any(region & border):
+        return True
+
+    area = np.count_nonzero(region)
+    previous_area = np.count_nonzero(previous < 0)
+
+    return abs(area - previous_area) > area_change * previous_area
+
+
+def segment_sequential(frames, warm: dict):
+    """Segment the frames one by one, starting each one from the level set of the
+    previous frame, moved as the bubble moved, when the warm start keeps it. The
+    warm start needs the centroids of the bubble in the two previous frames, and a
+    frame that it may have cut (see `lost_by_warm_start`) is segmented again from
+    the box.
+
+    Args:
+        frames (iterable): Pairs (name, frame) of the frames.
+        warm (dict): Last level set function and centroids of the bubble, updated
+                     by the caller after each frame.
+
+    Yields:
+        tuple: The name of each frame and the result of `segment_frame`.
+    """
+
+    for name, frame in frames:
+        init = None
+        if warm['phi'] is not None and len(warm['centroids']) == 2:
+            ## INITIALIZE LSF FROM THE PREVIOUS FRAME, MOVED AS THE BUBBLE MOVED ##
+            (dx, dy) = np.subtract(warm['centroids'][1], warm['centroids'][0])
+            init = shift_level_set(warm['phi'], dx, dy, WORKER['params']['c'],
+                                   WORKER['params']['margin'])
+
+        ## THE LEVEL SET EVOLVES IN PLACE: THE INITIAL REGION IS KEPT BEFORE ##
+        start = None if init is None else init < 0
+        result = segment_frame(frame, init)
+
+        ## THE WARM START MAY HAVE CUT THE BUBBLE: SEGMENTING AGAIN FROM THE BOX ##
+        if init is not None and result[0] is not None and \
+                lost_by_warm_start(result[0], start, warm['phi'],
+                                   WORKER['params']['area_change']):
+            result = segment_frame(frame)
+
+        yield (name, result)
 
 
 if __name__ == "__main__":
@@ -29,6 +224,42 @@ if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("-f", "--file", required=True,
                     help="path to the input JSON file")
+    ap.add_argument("--float32", action='store_true',
+                    help="evolve the level set in single precision")
+    ap.add_argument("-t", "--tolerance", type=int, default=0,
+                    help="pixels allowed to change of side of the contour in an outer loop "
+                         "to stop the evolution (default: 0)")
+    ap.add_argument("-w", "--warm-start", action='store_true',
+                    help="start each frame from the contour of the previous one, "
+                         "moved by the displacement of the bubble")
+    ap.add_argument("-m", "--margin", type=int, default=5,
+                    help="pixels added around the contour of the previous frame in the "
+                         "warm start (default: 5)")
+    ap.add_argument("-r", "--roi-margin", type=int, default=10,
+                    help="pixels added around the flow area to segment the frames "
+                         "(default: 10)")
+    ap.add_argument("-j", "--jobs", type=int, default=1,
+                    help="number of processes segmenting the frames (default: 1)")
+    ap.add_argument("-b", "--band", type=int, default=0,
+                    help="half width in pixels of the narrow band where the level set "
+                         "is updated, 0 to update the whole frame (default: 0)")
+    ap.add_argument("-v", "--video",
+                    help="read the frames from this video (.avi or .mp4) instead of the "
+                         "frames folder of the node")
+    ap.add_argument("--start", type=int, default=0, help="first frame (default: 0)")
+    ap.add_argument("--stop", type=int, help="frame after the last one (default: the end)")
+    ap.add_argument("--jpeg", action='store_true',
+                    help="also write the binary images as JPEG in the bwFramesPath folder")
+    ap.add_argument("--fps", type=float,
+                    help="frames per second of the recording (default: the one of the video "
+                         "or store, the velocities are in pixels per frame without it)")
+    ap.add_argument("-d", "--max-distance", type=float, default=20,
+                    help="maximum distance in pixels to link a bubble between two frames "
+                         "(default: 20)")
+    ap.add_argument("--min-frames", type=int, default=3,
+                    help="frames of the shortest track kept, shorter ones are noise (default: 3)")
+    ap.add_argument("--min-area", type=float, default=10,
+                    help="mean area in pixels of the smallest track kept (default: 10)")
     args = vars(ap.parse_args())
     input_path = ''
 
@@ -38,6 +269,14 @@ if __name__ == "__main__":
         print('ERROR! JSON file not found.')
         os.sys.exit(1)
 
+    if args['video'] and not os.path.exists(args['video']):
+        print('ERROR! Video not found.')
+        os.sys.exit(1)
+
+    if args['warm_start'] and args['jobs'] > 1:
+        print('ERROR! The warm start needs the frames in order (--jobs 1).')
+        os.sys.exit(1)
+
     ## READ JSON FILE ##
     with open(input_path, 'r', encoding='utf-8') as file:
         dataset = json.load(file)
@@ -55,8 +294,7 @@ if __name__ == "__main__":
     area_coord = node['flowAreaCoord']
     bw_frames_path = node_path + node['bwFramesPath']
     frames_path = node_path + node['framesPath']
-    frames = sorted(os.listdir(frames_path))
-    total_frames = len(frames)
+    source = open_frames(args['video'] or frames_path, gray=True)[args['start']:args['stop']]
 
     ## SETTING PARAMETERS ##
     # Time step, reasonable values in range [0.1; 5].
@@ -93,85 +331,134 @@ if __name__ == "__main__":
     # Number of iterations in internal loop
     iter_inner = 20
 
-    # Number of iterations in external loop
+    # Maximum number of iterations in external loop. The evolution stops before
+    # when the zero level contour does not move more than the tolerance.
     iter_outer = 30
+    tolerance = args['tolerance']
     potential = 2
     if potential == 1:
         potential_function = 'single-well'
     else:
         potential_function = 'double-well'
 
+    # Number of iterations in internal loop made at the end, with α=0.
+    iter_refine = 10
+
+    # Rows of the frames taken for the nozzle, and region of interest inside them
+    (top, bottom) = (5, 195) if diameter == 4 else (5, 220)
+    img_shape = (min(bottom, backg.shape[0]) - top, backg.shape[1])
+    (roi, roi_coord) = dip.get_roi(area_coord, img_shape, args['roi_margin'])
+    crop = (slice(top + roi[0].start, top + roi[0].stop), roi[1])
+
+    params = {
+        'crop': crop,
+        'roi': roi,
+        'roi_coord': roi_coord,
+        'img_shape': img_shape,
+        'sigma': sigma,
+        'timestep': timestep,
+        'mu': mu,
+        'lmda': lmda,
+        'epsilon': epsilon,
+        'alpha': alpha,
+        'c': c,
+        'potential_function': potential_function,
+        'iter_inner': iter_inner,
+        'iter_outer': iter_outer,
+        'iter_refine': iter_refine,
+        'tolerance': tolerance,
+        'dtype': np.float32 if args['float32'] else np.float64,
+        'band': args['band'],
+        'margin': args['margin'],
+        'area_change': 0.2
+    }
+
     # Selector to decide which bubble is taken
     flowing = True
 
     ## Indicate if the object is selected
     selected = 1
 
-    ## START PROCESSING ##
-    for i in range(total_frames):
-
-        ## LOADING IMAGE ##
-        full_name_frame = frames[i]
-        short_name_frame, _ = full_name_frame.split('.')
-        frame = cv.imread(frames_path + full_name_frame, 0)
-
-        ## REMOVIMG BACKGROUND ##
-        img = dip.subtract(frame, backg, thresh=15)
-        if diameter == 4:
-            img = img[5:195, ...]
-        else:
-            img = img[5:220, ...]
-
-        ## SMOOTHING IMAGE BY GAUSSIAN CONVOLUTION ##
-        smoothed_img = dip.clean_image(img, area_coord, sigma)
-
-        if np.count_nonzero(smoothed_img):
-            ## CALCULATE GRADIENT & DEFINE EDGE INDICATOR FUNCTION ##
-            [Iy, Ix] = np.gradient(smoothed_img)
-            f = np.square(Ix) + np.square(Iy)
-            edge_indicator_function = 1 / (1 + f)
-
-            ## INITIALIZE LSF AS BINARY STEP FUNCTION & GENERATE THE INITIAL REGION R0 ##
-            init_LSF = c * np.ones(smoothed_img.shape)
-            init_LSF[1:-5, 140:215] = -c
-            phi = init_LSF.copy()
-
-            ## START LEVEL SET EVOLUTION ##
-            for k in range(iter_outer):
-                phi = drlse_edge(phi, edge_indicator_function, lmda, mu,
-                                 epsilon, timestep, iter_inner, potential_function, alpha)
-                # if np.mod(k, 2) == 0:
-                #     plt.clf()
-                #     dip.get_image_contours(img, phi, fig_title=short_name_frame)
-                #     plt.pause(0.1)
-
-            ## REFINE THE ZERO LEVEL CONTOUR BY FURTHER LEVEL SET EVOLUTION WITH (alpha=0) ##
-            # Number of iterations in internal loop made at the end, with α=0.
-            iter_refine = 10
-            phi = drlse_edge(phi, edge_indicator_function, lmda, mu,
-                             epsilon, timestep, iter_refine, potential_function)
-
-            ## BINARIZE IMAGE ##
-            final_LSF = np.array(phi.copy())
-            (_, bw_image) = cv.threshold(final_LSF, 0, 255, cv.THRESH_BINARY_INV)
+    ## Outer loops done in each segmented frame
+    iterations = []
+
+    ## Last level set and centroids of the bubble being followed, for the warm start
+    warm_start = args['warm_start']
+    warm = {'phi': None, 'centroids': [], 'selected': selected}
+
+    ## PHASE 1: SEGMENTING THE FRAMES, IN ORDER OR IN A POOL OF PROCESSES ##
+    frames = (((i, source.name(i)), np.ascontiguousarray(frame[crop])) for i, frame in source)
+    executor = None
+    if args['jobs'] > 1:
+        executor = ProcessPoolExecutor(max_workers=args['jobs'], initializer=init_worker,
+                                       initargs=(backg[crop], params))
+        results = segment_parallel(executor, frames, 4 * args['jobs'])
+    else:
+        init_worker(backg[crop], params)
+        results = segment_sequential(frames, warm)
+
+    ## PHASE 2: SELECTING AND NUMBERING THE BUBBLES IN ORDER ##
+    masks = MaskStoreWriter(node_path + MASKS_FILE, img_shape)
+    tracker = BubbleTracker(args['max_distance'], min_frames=args['min_frames'],
+                            min_area=args['min_area'])
+    origin = np.array([roi[1].start, roi[0].start])
+    try:
+        for (index, short_name_frame), (phi, bw_image, outer_loops) in results:
+            if bw_image is None:
+                ## NO BUBBLE IN THE FRAME: THE NEXT ONE STARTS FROM THE BOX ##
+                warm['phi'], warm['centroids'] = None, []
+                continue
+            iterations.append(outer_loops)
+
+            ## FOLLOWING ALL THE OBJECTS, IN THE COORDINATES OF THE FRAME ##
+            analysis = dip.FrameAnalysis(bw_image)
+            (x, y, w, h) = analysis.bboxes.T
+            bboxes = np.column_stack((y, y + h, x, x + w)) + origin[[1, 1, 0, 0]]
+            tracker.update(index, analysis.centroids + origin, bboxes, analysis.areas)
 
             ## DETECTING BUBBLE ##
             (selected, flowing, bw_image) = dip.get_main_bubble(
-                bw_image, flowing, selected)
+                bw_image, flowing, selected, offset=roi[0].start, analysis=analysis)
+
+            ## KEEP THE CONTOUR FOR THE NEXT FRAME WHILE THE SAME BUBBLE IS FLOWING ##
+            if warm_start:
+                if flowing and np.count_nonzero(bw_image):
+                    if selected != warm['selected']:
+                        warm['centroids'] = []
+                    warm['phi'] = phi
+                    warm['centroids'] = warm['centroids'][-1:] + [dip.get_centroid(bw_image)]
+                else:
+                    warm['phi'], warm['centroids'] = None, []
+                warm['selected'] = selected
 
             if flowing:
-                ## SAVE IMAGE WITH DRLSE ##
-                dip.get_image_contours(smoothed_img, final_LSF)
-                plt.axis(False)
-                plt.close()
-
-                ## SAVE BINARY IMAGE ##
-                cv.imwrite('{}{}-{}.jpg'.
-                           format(bw_frames_path, short_name_frame, selected), bw_image)
+                ## SAVE BINARY IMAGE, BACK IN THE COORDINATES OF THE FRAME ##
+                full_image = np.zeros(img_shape, dtype=bw_image.dtype)
+                full_image[roi] = bw_image
+                masks.add(selected, index, short_name_frame, full_image)
+                if args['jpeg']:
+                    cv.imwrite('{}{}-{}.jpg'.
+                               format(bw_frames_path, short_name_frame, selected), full_image)
 
                 ## SHOW MESSAGE ##
-                print('Image {} for nozzle diameter {} mm was segmented.'.
-                      format(short_name_frame, diameter))
-        else:
-            pass
-    # ## ENDFOR ##
+                print('Image {} for nozzle diameter {} mm was segmented in {} loops.'.
+                      format(short_name_frame, diameter, outer_loops))
+        # ## ENDFOR ##
+
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    masks.close()
+    write_index(node_path + INDEX_FILE, masks.index())
+    print('{} masks saved in {}'.format(len(masks.bubbles), node_path + MASKS_FILE))
+
+    tracks = tracker.tracks(args['fps'] or source.fps)
+    save_tracks(node_path + TRACKS_FILE, tracks)
+    print('{} bubbles tracked, saved in {}'.format(len(tracks['ids']), node_path + TRACKS_FILE))
+    if np.isnan(tracks['fps']):
+        print('WARNING! Unknown fps, the velocities of the tracks are in px/frame (use --fps).')
+
+    if iterations:
+        print('Outer loops per frame: mean = {:.1f}, max = {} (limit {})'.
+              format(np.mean(iterations), np.max(iterations), iter_outer))
@@ -5,17 +5,20 @@
 Dev: 	adejonghm
 ----------
 
-Create a video from images, it can be in slow motion.
+Create a video from images or from a frame store, it can be in slow motion.
 """
 
 
 # Standard library imports
-from os import listdir, path, sys
+from os import sys
 
 # Third party imports
 import cv2 as cv
 from tqdm import tqdm
 
+# Local application imports
+from dsip.frames import open_frames
+
 
 if __name__ == "__main__":
 
@@ -28,23 +31,20 @@ if __name__ == "__main__":
 
     input_path = sys.argv[1] if sys.argv[1].endswith('/') else sys.argv[1] + '/'
 
-    images = []
-
-    for img in sorted(listdir(input_path)):
-        if img.endswith('.jpg'):
-            images.append(img)
+    frames = open_frames(input_path, gray=False)
+    if not len(frames):
+        print('ERROR! No frames found in {}'.format(input_path))
+        sys.exit(1)
 
-    frame_path = path.join(input_path, images[0])
-    frame = cv.imread(frame_path)
-    height, width, channels = frame.shape
+    height, width = frames[0].shape[:2]
 
     fourcc = cv.VideoWriter_fourcc(*'MP4V')
     video = cv.VideoWriter('slow_motion.mp4', fourcc, 20, (width, height))
 
-    for img in tqdm(images):
-        temp_path = path.join(input_path, img)
-        temp_img = cv.imread(temp_path)
-        video.write(temp_img)
+    for _, frame in tqdm(frames, total=len(frames)):
+        if frame.ndim == 2:
+            frame = cv.cvtColor(frame, cv.COLOR_GRAY2BGR)
+        video.write(frame)
 
     video.release()
     cv.destroyAllWindows()
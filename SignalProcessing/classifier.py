@@ -15,7 +15,6 @@ import argparse
 # Third party imports
 import numpy as np
 from matplotlib import pyplot as plt
-from scipy.fftpack import fft, fftfreq
 
 # Local application imports
 from dsip import sigproc as dsp
@@ -30,33 +29,24 @@ if __name__ == "__main__":
     args = vars(ap.parse_args())
 
     signal = np.loadtxt('signal_1.csv')
-    vol = 0
     Fs = 48000
-    frequencies = []
     bubble_length = 4500
     time = len(signal) / Fs
 
     peaks = dsp.get_peaks(signal, bubble_length, max_value=800)
+    peak_freqs, _, spectra, f_axis = dsp.get_spectra(signal, peaks, bubble_length, fs=Fs)
+    frequencies = peak_freqs.astype(int)
 
-    for i, peak in enumerate(peaks):
-        bubble, _ = dsp.get_bubble(signal, peak, bubble_length, fs=Fs)
-        fast_fourier_transform = abs(fft(2 * bubble) / bubble_length)
-        position = np.where(fast_fourier_transform ==
-                            max(fast_fourier_transform))
-        f_axis = fftfreq(bubble_length) * Fs
-        freq = int(f_axis[position[0][0]])
-        frequencies.append(freq)
+    # radius in mm
+    radii = dsp.get_radius(frequencies) * 1000
 
-        # radius in mm
-        r = dsp.get_radius(freq) * 1000
-
-        # volume in mm^3
-        vol += (4 * np.pi * np.power(r, 3)) / 3
+    # volume in mm^3
+    vol = np.sum((4 * np.pi * np.power(radii, 3)) / 3)
 
+    for freq, fast_fourier_transform in zip(frequencies, spectra):
         plt.plot(f_axis, fast_fourier_transform,
                  marker='.', label='{} Hz'.format(freq))
-        plt.xlim(500, 1500)
-
+    plt.xlim(500, 1500)
 
     scenarios = dsp.frequency_classifier(frequencies)
     print('Leak = {} mm³/s'.format(np.round(vol / time, 2)))
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+"""
+Dev: 	adejonghm
+----------
+
+Run the whole acoustic chain (cut -> filter -> separate -> spectral analysis)
+over every node of the dataset, in parallel, and merge the results of all
+the nodes in a single JSON file.
+"""
+
+
+# Standard library imports
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Third party imports
+import numpy as np
+from scipy import signal
+from scipy.io import wavfile
+
+# Local application imports
+import dsip.cache as dsc
+import dsip.sigproc as dsp
+
+
+def process_node(number: int, db_path: str, size: int, node: dict, params: dict) -> dict:
+    """Cut, filter and separate the acoustic signal of a node, and find the
+    frequency of each bubble.
+
+    Args:
+        number (int): Position of the node in the dataset.
+        db_path (str): Path of the dataset.
+        size (int): Number of samples of a bubble.
+        node (dict): Node of the dataset.
+        params (dict): Parameters of the chain (block, max_value and correction).
+
+    Returns:
+        dict: Results of the node.
+    """
+
+    node_path = db_path + node['path']
+    block = params['block']
+
+    # CUT & FILTER: THE CUT SIGNAL IS TAKEN FROM THE CACHE WHEN IT WAS ALREADY SAVED
+    if node.get('audioCutted') and os.path.exists(node_path + node['audioCutted']):
+        Fs, wave_filtered = dsc.get_filtered(node_path + node['audioCutted'], 15, 500, 'hp',
+                                             block_size=block)
+    else:
+        Fs, wave = wavfile.read(node_path + node['audioName'], mmap=True)
+        peaks = list(dsp.stream_peaks(dsp.iter_blocks(wave, block), size))
+        max_values = np.concatenate(peaks or [np.array([], dtype=int)])
+        if len(max_values) < 2:
+            raise ValueError('No marks found in {}.'.format(node_path + node['audioName']))
+        sos = signal.butter(15, 500, 'hp', fs=Fs, output='sos')
+        blocks = dsp.iter_blocks(wave[max_values[0]:max_values[-1]], block)
+        wave_filtered = np.concatenate([b for _, b in dsp.filter_blocks(blocks, sos)])
+
+    # SEPARATE
+    blocks = dsp.iter_blocks(wave_filtered, block)
+    points = np.concatenate(list(dsp.stream_peaks(blocks, size, params['max_value'])) or
+                            [np.array([], dtype=int)])[1:-1]
+    starts = points - params['correction']
+    starts = starts[starts >= 0]
+
+    # SPECTRAL ANALYSIS
+    peak_freqs, _, _, _ = dsp.get_spectra(wave_filtered, starts, size, Fs)
+    frequencies = peak_freqs.astype(int)
+
+    # A BUBBLE WITHOUT FREQUENCY HAS NO RADIUS, IT IS LEFT OUT AS IN leak_monitor.py
+    found = frequencies != 0
+    (starts, frequencies) = (starts[found], frequencies[found])
+    radii = dsp.get_radius(frequencies) * 1000
+    volumes = (4 * np.pi * np.power(radii, 3)) / 3
+
+    return {
+        'node': number,
+        'diameter': node.get('diameter'),
+        'bubbles': len(starts),
+        'bubblesStart': starts.tolist(),
+        'frequencies': frequencies.tolist(),
+        'meanFrequency': round(float(np.mean(frequencies)), 2) if len(starts) else None,
+        'radii': np.round(radii, 3).tolist(),
+        'leak': round(float(np.sum(volumes) / (len(wave_filtered) / Fs)), 2)
+    }
+
+
+if __name__ == "__main__":
+
+    #### CONSTRUCT ARGUMENT PARSE ####
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-f", "--file", required=True, help="path to the input JSON file")
+    ap.add_argument("-o", "--output", default='results.json',
+                    help="path to the output JSON file (default: results.json)")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                    help="number of worker processes (default: number of CPUs)")
+    ap.add_argument("-n", "--nodes", type=int, nargs='+',
+                    help="nodes to be processed (default: all of them)")
+    ap.add_argument("-b", "--block", type=int, default=2**20,
+                    help="number of samples read at once (default: 1048576)")
+    ap.add_argument("-m", "--max-value", type=float, default=1000,
+                    help="amplitude threshold used to separate the bubbles (default: 1000)")
+    ap.add_argument("-c", "--correction", type=int, default=321,
+                    help="samples from the peak back to the start of a bubble (default: 321)")
+    args = vars(ap.parse_args())
+    input_path = ''
+
+    if args['file'].endswith('.json') and os.path.exists(args['file']):
+        input_path = args['file']
+    else:
+        print('ERROR! JSON file not found.')
+        os.sys.exit(1)
+
+    #### READ JSON FILE ####
+    with open(input_path, 'r', encoding='utf-8') as file:
+        dataset = json.load(file)
+
+    #### PARAMETERS ####
+    db_path = dataset[0]['path']
+    size = dataset[0]['bubbleLength']
+    numbers = args['nodes'] or range(1, len(dataset))
+    params = {
+        'block': args['block'],
+        'max_value': args['max_value'],
+        'correction': args['correction']
+    }
+
+    #### RUNNING ALL THE NODES ####
+    results = []
+    with ProcessPoolExecutor(max_workers=args['jobs']) as executor:
+        futures = [executor.submit(process_node, i, db_path, size, dataset[i], params)
+                   for i in numbers]
+
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            print('Node {} ({} mm): {} bubbles, leak = {} mm³/s'.format(
+                result['node'], result['diameter'], result['bubbles'], result['leak']))
+
+    with open(args['output'], 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2, separators=(',', ':'))
+    print('*SAVED*')
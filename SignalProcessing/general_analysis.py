@@ -17,11 +17,9 @@ import os
 # Third party imports
 import numpy as np
 from matplotlib import pyplot as plt
-from scipy import signal
-from scipy.io import wavfile
-from scipy.fftpack import fft, fftfreq
 
 # Local application imports
+import dsip.cache as dsc
 import dsip.sigproc as dsp
 
 # Setting Plot parameters
@@ -49,9 +47,6 @@ if __name__ == "__main__":
         dataset = json.load(file)
 
     for i in range(1, 4):
-        f_axis = []
-        frequencies = []
-        f_bins = []
         node = dataset[i]
         audio_path = dataset[0]['path'] + node['path'] + node['audioCutted']
         beginnings = node['bubblesStart']
@@ -60,12 +55,8 @@ if __name__ == "__main__":
         Eo = node['Eotvos_Numbers']
         Re = node['Reynolds_Numbers']
 
-        #### LOADING AUDIO FILE ####
-        Fs, wave = wavfile.read(audio_path)
-
-        #### FILTRANDO EL AUDIO ####
-        sos = signal.butter(15, 500, 'hp', fs=Fs, output='sos')
-        wave_filtered = signal.sosfilt(sos, wave)
+        #### LOADING & FILTERING THE AUDIO FILE (CACHED) ####
+        Fs, wave_filtered = dsc.get_filtered(audio_path, 15, 500, 'hp')
 
         #### SETTING PARAMETERS ####
         total_bubbles = len(beginnings)
@@ -73,25 +64,14 @@ if __name__ == "__main__":
         N = len(wave_filtered)
         half = N / 2
 
-        for k in range(total_bubbles):
-            bubble = dsp.get_bubble(wave_filtered, beginnings[k], size)
-            bubble_length = len(bubble[0])
-            f_axis = fftfreq(bubble_length) * Fs
-
-            fast_fourier_transform = abs(fft(2 * bubble[0]) / bubble_length)
-            position = fast_fourier_transform.tolist().index(max(fast_fourier_transform))
-
-            freq = int(f_axis[position])
-            radius = dsp.get_radius(freq)
-
-            f_bins.append(fast_fourier_transform)
-            frequencies.append(freq)
+        peak_freqs, _, f_bins, f_axis = dsp.get_spectra(wave_filtered, beginnings, size, Fs)
+        frequencies = peak_freqs.astype(int)
 
         #### MEAN FREQUENCIES ####
         mean_freq = np.mean(frequencies)
         mean_bins = np.mean(f_bins, axis=0)
         v_max = mean_bins.max()
-        p_max = mean_bins.tolist().index(v_max)
+        p_max = np.argmax(mean_bins)
         f_max = f_axis[p_max]
 
         #### FFT LABELS ####
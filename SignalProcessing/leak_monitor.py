@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+"""
+Dev: 	adejonghm
+----------
+
+Real-time leak monitor. Raw audio samples are read from stdin, a FIFO or a file
+being appended to, and the same estimate of classifier.py is computed as the
+samples arrive: frequency -> radius (Minnaert) -> volume -> leak rate.
+
+Example:
+  arecord -t raw -f S16_LE -r 48000 | python leak_monitor.py -i -
+"""
+
+# Standard library imports
+import argparse
+import json
+import os
+from collections import deque
+from time import perf_counter
+
+# Third party imports
+import numpy as np
+from scipy import signal
+
+# Local application imports
+from dsip import sigproc as dsp
+
+
+def emit(event: dict):
+    """Write an event as a JSON line on the standard output.
+
+    Args:
+        event (dict): Event to be written.
+    """
+
+    print(json.dumps(event), flush=True)
+
+
+if __name__ == "__main__":
+
+    #### CONSTRUCT ARGUMENT PARSE ####
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-i", "--input", required=True,
+                    help="raw audio source: path to a file or FIFO, or '-' for stdin")
+    ap.add_argument("-r", "--rate", type=int, default=48000,
+                    help="sampling frequency (default: 48000)")
+    ap.add_argument("--dtype", default='int16',
+                    help="type of the samples (default: int16)")
+    ap.add_argument("-b", "--block", type=float, default=0.1,
+                    help="duration of each block in seconds (default: 0.1)")
+    ap.add_argument("-l", "--length", type=int, default=4500,
+                    help="number of samples of a bubble (default: 4500)")
+    ap.add_argument("-m", "--max-value", type=float, default=800,
+                    help="amplitude threshold of the peaks (default: 800)")
+    ap.add_argument("-w", "--window", type=float, default=10,
+                    help="seconds used for the rolling leak rate (default: 10)")
+    ap.add_argument("--highpass", type=float, default=0,
+                    help="cutoff of a high-pass filter in Hz, 0 to disable (default: 0)")
+    ap.add_argument("--follow", action='store_true',
+                    help="wait for new samples at the end of the input file")
+    args = vars(ap.parse_args())
+
+    if args['input'] == '-':
+        source = os.sys.stdin.buffer
+    elif os.path.exists(args['input']):
+        source = open(args['input'], 'rb')
+    else:
+        print('ERROR! Audio source not found.')
+        os.sys.exit(1)
+
+    #### PARAMETERS ####
+    Fs = args['rate']
+    bubble_length = args['length']
+    window = args['window']
+    block_size = max(int(Fs * args['block']), 1)
+
+    #### PROCESSING CHAIN ####
+    blocks = dsp.read_stream(source, block_size, args['dtype'], follow=args['follow'])
+    if args['highpass'] > 0:
+        sos = signal.butter(15, args['highpass'], 'hp', fs=Fs, output='sos')
+        blocks = dsp.filter_blocks(blocks, sos)
+
+    state = {'volumes': deque(), 'total': 0, 'samples': 0}
+    start_clock = perf_counter()
+
+    def report(items):
+        """Pass the blocks through, writing the rolling leak rate once the bubbles
+        of the previous block were processed, with its latency and the lag."""
+        for offset, block in items:
+            clock = perf_counter()
+            yield (offset, block)
+
+            # Next block requested: the bubbles completed by this one are done
+            state['samples'] = offset + len(block)
+            audio_time = state['samples'] / Fs
+            volumes = state['volumes']
+            while volumes and volumes[0][0] < audio_time - window:
+                volumes.popleft()
+
+            leak = sum(v for _, v in volumes) / min(window, audio_time)
+            emit({'event': 'leak', 'time': round(audio_time, 4), 'leak': round(leak, 2),
+                  'latency': round((perf_counter() - clock) * 1000, 2),
+                  'lag': round(max(perf_counter() - start_clock - audio_time, 0), 3)})
+
+    try:
+        for start, bubble in dsp.detect_bubbles(report(blocks), bubble_length, args['max_value']):
+            freq, _, _, _ = dsp.get_windows_spectra(bubble[np.newaxis], Fs)
+            freq = int(freq[0])
+            if freq == 0:
+                continue
+
+            # radius in mm and volume in mm^3
+            radius = dsp.get_radius(freq) * 1000
+            vol = (4 * np.pi * np.power(radius, 3)) / 3
+            bubble_time = start / Fs
+
+            state['volumes'].append((bubble_time, vol))
+            state['total'] += vol
+            emit({'event': 'bubble', 'time': round(bubble_time, 4), 'frequency': freq,
+                  'radius': round(radius, 3), 'volume': round(vol, 3)})
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        audio_time = state['samples'] / Fs
+        if audio_time > 0:
+            print('Leak = {} mm³/s'.format(np.round(state['total'] / audio_time, 2)))
@@ -18,14 +18,13 @@ import os
 import cv2 as cv
 import numpy as np
 from matplotlib import pyplot as plt
-from scipy import signal
-from scipy.io import wavfile
-from scipy.fftpack import fft, fftfreq
 from skimage import feature as sk_feature
 
 # Local application imports
+from dsip import cache as dsc
 from dsip import sigproc as dsp
 from dsip import improc as dip
+# from dsip.masks import MASKS_FILE, MaskStore
 
 
 # Setting Plot parameters
@@ -63,64 +62,44 @@ if __name__ == "__main__":
     beginnings = node['bubblesStart']
     node_path = db_path + node['path']
     audio_path = node_path + node['audioCutted']
-    bw_img_path = node_path + node['bwFramesPath']
 
-    # LOADING AUDIO FILE
-    Fs, wave = wavfile.read(audio_path)
-
-    # FILTERING THE SIGNAL
-    sos = signal.butter(15, 500, 'hp', fs=Fs, output='sos')
-    # sos = signal.butter(15, (500, 1500), 'bandpass', fs=Fs, output='sos')
-    wave_filtered = signal.sosfilt(sos, wave)
-
-    # GETTING BW IMAGES LIST
-    bw_images_list = sorted(os.listdir(bw_img_path))
+    # LOADING & FILTERING THE SIGNAL (CACHED)
+    Fs, wave_filtered = dsc.get_filtered(audio_path, 15, 500, 'hp')
+    # Fs, wave_filtered = dsc.get_filtered(audio_path, 15, (500, 1500), 'bandpass')
 
     # SETTING PARAMETERS
     Ts = 1 / Fs
     N = len(wave_filtered)
     time = np.arange(0, N/Fs, Ts)
     speed_deformation = []
-    frequencies = []
     Eo = []
     Re = []
-    k = 0
-    index, _ = bw_images_list[k].split('.')[0].split('-')
 
-    #### CALCUTAING THE FFT OF A BUBBLE ####
-    for i, begg in enumerate(beginnings):
-        bubble = dsp.get_bubble(wave_filtered, begg, bubble_length, Fs)
-        f_axis = fftfreq(bubble_length) * Fs
+    #### CALCUTAING THE FFT OF ALL BUBBLES ####
+    peak_freqs, _, spectra, f_axis = dsp.get_spectra(wave_filtered, beginnings, bubble_length, Fs)
+    frequencies = peak_freqs.astype(int).tolist()
+    radii = dsp.get_radius(peak_freqs.astype(int))
 
-        fast_fourier_transform = abs(fft(2 * bubble[0]) / bubble_length)
-        position = fast_fourier_transform.tolist().index(max(fast_fourier_transform))
+    # PLOTTING THE FFT OF THE BUBBLES
+    plt.title(
+        'Frequency Domain [Diameter of nozzle: {} mm]'.format(diameter))
+    plt.xlabel('Freq. [Hz]')
+    plt.ylabel('Amplitude')
+    plt.plot(f_axis, spectra.T, marker='.')
+    plt.xlim(500, 1500)
 
-        freq = int(f_axis[position])
-        radius = dsp.get_radius(freq)
+    # GETTING THE MASKS OF THE BUBBLES, FOR THE DEFORMATION RATE
+    # store = MaskStore(node_path + MASKS_FILE)
 
-        frequencies.append(freq)
+    for i, begg in enumerate(beginnings):
+        radius = radii[i]
         step = 5
 
-        # PLOTTING THE FFT OF A BUBBLE
-        plt.title(
-            'Frequency Domain [Diameter of nozzle: {} mm]'.format(diameter))
-        plt.xlabel('Freq. [Hz]')
-        plt.ylabel('Amplitude')
-        plt.plot(f_axis, fast_fourier_transform, marker='.')
-        plt.xlim(500, 1500)
-
         # ESTIMATING DEFORMATION RATE
-        # while int(index) - 1 == i:
-        #     img_1 = dip.center_bubble(
-        #         cv.imread(bw_img_path + bw_images_list[k], 0))
-        #     _, img_1 = cv.threshold(img_1, 200, 255, cv.THRESH_BINARY)
-
-        #     if (k + step) < len(bw_images_list):
-        #         img_2 = dip.center_bubble(
-        #             cv.imread(bw_img_path + bw_images_list[k + step], 0))
-        #         _, img_2 = cv.threshold(img_2, 200, 255, cv.THRESH_BINARY)
-        #     else:
-        #         break
+        # (_, masks) = store.masks(i + 1)
+        # for k in range(0, len(masks) - step, step + 1):
+        #     img_1 = dip.center_bubble(masks[k].astype(np.uint8) * 255)
+        #     img_2 = dip.center_bubble(masks[k + step].astype(np.uint8) * 255)
 
         #     img_dif = abs(img_2 - img_1)
 
@@ -139,13 +118,6 @@ if __name__ == "__main__":
         #     # Average Deformation Rate
         #     speed_deformation.append(mean_local_max / (6e-2 * step))
 
-        #     # Getting The Next Image
-        #     k += step + 1
-        #     if k < len(bw_images_list):
-        #         index, _ = bw_images_list[k].split('.')[0].split('-')
-        #     else:
-        #         break
-
         # mean_speed_deformation = float(np.mean(speed_deformation))
         # Eo.append(round(dsp.get_eotvos(radius), 3))
         # Re.append(round(dsp.get_reynolds(radius, mean_speed_deformation), 3))
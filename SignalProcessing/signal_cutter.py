@@ -15,6 +15,7 @@ import json
 import argparse
 
 # Third party imports
+import numpy as np
 from scipy.io import wavfile
 
 # Local application imports
@@ -26,6 +27,8 @@ if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("-f", "--file", required=True,
                     help="path to the input JSON file")
+    ap.add_argument("-b", "--block", type=int, default=2**20,
+                    help="number of samples read at once (default: 1048576)")
     args = vars(ap.parse_args())
     input_path = ''
 
@@ -46,11 +49,15 @@ if __name__ == "__main__":
     name = node['audioName'][:-4]
     audio_path = db_path + node['path'] + node['audioName']
 
-    #### LOADING AUDIO FILE ####
-    Fs, wave = wavfile.read(audio_path)
+    #### LOADING AUDIO FILE (MEMORY-MAPPED) ####
+    Fs, wave = wavfile.read(audio_path, mmap=True)
 
     #### CUTTING SIGNAL THAT MATCHES THE VIDEO ####
-    max_values = dsp.get_peaks(wave, size)
+    blocks = dsp.iter_blocks(wave, args['block'])
+    max_values = np.concatenate(list(dsp.stream_peaks(blocks, size)) or [np.array([], dtype=int)])
+    if len(max_values) < 2:
+        print('ERROR! No marks found in the acoustic signal.')
+        os.sys.exit(1)
     wave_cutted = wave[max_values[0]:max_values[-1]]
 
     wavfile.write('{}_cut.wav'.format(name), Fs, wave_cutted)
@@ -14,12 +14,11 @@ import os
 
 # Third party imports
 import numpy as np
-from scipy import signal
-from scipy.io import wavfile
-from scipy.fftpack import fft, fftfreq
 from matplotlib import pyplot as plt
 
 # Local application imports
+from dsip import cache as dsc
+from dsip import sigproc as dsp
 
 
 if __name__ == '__main__':
@@ -53,57 +52,33 @@ if __name__ == '__main__':
     bub_beginnings = node['bubblesStart']
     audio_path = node_path + node['audioCutted']
 
-    #### LOADING AUDIO FILE ####
-    Fs, wave = wavfile.read(audio_path)
+    #### LOADING & FILTERING THE AUDIO FILE (CACHED) ####
+    Fs, wave_filtered = dsc.get_filtered(audio_path, 15, (500, 1500), 'bandpass')
 
-    #### FILTERING THE SIGNAL ####
-    sos = signal.butter(15, (500, 1500), 'bandpass', fs=Fs, output='sos')
-    wave_filtered = signal.sosfilt(sos, wave)
+    #### LOOKING FOR THE EFFECTIVE LAMBDA OF EVERY BUBBLE
+    t_max = 2800
+    lmdas, freqs, q_errors = dsp.get_decay(wave_filtered, bub_beginnings, bub_length, Fs, t_max)
+    print('effective lambda: {} ± {} for {}mm diameter ({} bubbles)'.format(
+        round(float(np.mean(lmdas)), 5), round(float(np.std(lmdas)), 5), diameter, len(lmdas)))
 
     #### SELECT THE BUBBLE SIGNAL
-    start = bub_beginnings[5]
+    k = 5
+    start = bub_beginnings[k]
     end = start + bub_length
     bub_signal = wave_filtered[start:end]
 
     #### CREATE TIME VECTOR
-    Ts = 1 / Fs
     amp_max = np.max(bub_signal)
-    t_min = np.where(bub_signal == amp_max)[0][0]
-    t_max = 2800
+    t_min = np.argmax(bub_signal)
 
     #### LOAD THE REAL SIGNAL
     real_signal = bub_signal[t_min:t_max]
-    signal_length = len(real_signal)
-    t = np.arange(0, signal_length / Fs, Ts)
-    delta_t = (t_max - t_min) / signal_length
+    t = np.arange(len(real_signal)) / Fs
 
     ### FREQUENCY OF THE SIGNAL
-    fast_fourier_transform = abs(fft(2 * bub_signal) / len(bub_signal))
-    position = np.where(fast_fourier_transform == max(fast_fourier_transform))[0][0]
-    f_axis = fftfreq(len(bub_signal)) * Fs
-    f = f_axis[position]
+    f = freqs[k]
     omega = f * 2 * np.pi
-
-    #### CREATE LAMBDA VECTOR
-    lmda_min = 0.01
-    lmda_max = 1
-    lmda_length = 1000
-    lmda = lmda_min
-    delta_lmda = (lmda_max - lmda_min) / lmda_length
-
-    q_error = np.zeros(lmda_length)
-
-    #### LOOKING FOR EFFECTIVE LAMBDA
-    for i in range(lmda_length):
-        x = amp_max * np.cos(omega * t) * np.exp(-np.pi * lmda * f * t)
-        q_diff = np.power(real_signal - x, 2)
-        q_error[i] = np.sum(q_diff)
-        lmda = lmda_min + i * delta_lmda
-
-    minimal_error = np.min(q_error)
-    index = np.where(q_error == minimal_error)[0][0]
-    lmda_effective = lmda_min + index * delta_lmda
-    print('effective lambda: {} for {}mm diameter'.format(lmda_effective, diameter))
+    lmda_effective = lmdas[k]
 
     #### CREATING THE IDEAL SIGNAL WITH THE EFFECTIVE LAMBDA
     ideal_signal = amp_max * np.cos(omega * t) * np.exp(-np.pi * lmda_effective * f * t)
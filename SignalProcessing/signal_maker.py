@@ -6,12 +6,15 @@ Dev: 	adejonghm
 ----------
 
 Generator of an acoustic signal with random frequencies taken from the Dataset.
+By default a 10 seconds signal is created and plotted. With the --output option,
+a signal of any duration is written block by block to a WAV (int16) or a .npy file.
 """
 
 # Standard library imports
 import argparse
 import json
 import os
+import wave
 
 # Third party imports
 from matplotlib import pyplot as plt
@@ -21,10 +24,38 @@ import numpy as np
 from dsip import sigproc as dsp
 
 
+def random_bubbles(dataset: list, counts: list, bub_time: np.ndarray, rng: np.random.Generator) -> tuple:
+    """Create the bubbles of each stage from random values taken from the dataset.
+
+    Args:
+        dataset (list): Stages with the values of the bubbles.
+        counts (list): Number of bubbles of each stage.
+        bub_time (np.ndarray): Time vector of a bubble.
+        rng (np.random.Generator): Generator used to select the values.
+
+    Returns:
+        tuple: The bubbles, one per row, and the volume of each stage.
+    """
+
+    stages = [np.asarray(dsp.create_random_stage(dataset[i], n, rng), dtype=float).T
+              for i, n in enumerate(counts)]
+    freq, amplitude, _, delta = np.concatenate(stages).T
+    volumes = [np.sum(stage[:, 2]) for stage in stages]
+
+    return (dsp.create_signals(freq, delta, bub_time, amplitude), volumes)
+
+
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("-f", "--file", required=True,
                     help="path to the input JSON file")
+    ap.add_argument("-o", "--output",
+                    help="path to the output file (.wav or .npy), written block by block")
+    ap.add_argument("-s", "--seconds", type=float, default=10,
+                    help="duration of the signal in seconds (default: 10)")
+    ap.add_argument("-b", "--block", type=float, default=10,
+                    help="seconds generated at once when writing a file (default: 10)")
+    ap.add_argument("--seed", type=int, help="seed of the random generator")
     args = vars(ap.parse_args())
     input_path = ''
 
@@ -34,52 +65,98 @@ if __name__ == "__main__":
         print('ERROR! JSON file not found.')
         os.sys.exit(1)
 
+    if args['output'] and not args['output'].endswith(('.wav', '.npy')):
+        print('ERROR! The output file must be a .wav or a .npy file.')
+        os.sys.exit(1)
+
     with open(input_path, 'r', encoding='utf-8') as file:
         dataset = json.load(file)
 
     # PARAMETERS
     Fs = 48000
     length_bubble = 4500
-    Ts = 1 / Fs
-    bub_time = np.arange(0, length_bubble / Fs, Ts)
+    bub_time = np.arange(length_bubble) / Fs
+    rng = np.random.default_rng(args['seed'])
 
-    # CREATE BUBBLES FROM RANDOM VALUES TAKEN IN EACH STAGE
-    bubbles = []
-    volumes = []
+    # NUMBER OF BUBBLES OF EACH STAGE IN 10 SECONDS
     freqs_per_stage = [150, 500, 350]
-    total_freqs = sum(freqs_per_stage)
-    for i, n_freqs in enumerate(freqs_per_stage):
-        stage = np.asarray(dsp.create_random_stage(dataset[i], n_freqs)).T
-        vol = np.sum(stage[:, 2])
-        volumes.append(np.round(vol, 2))
-        for values in stage:
-            freq, amplitude, _, delta = values
-            bubbles.append(dsp.create_signal(freq, delta, bub_time, amplitude))
-
-    # CREATE THE SIGNAL VECTOR WITH WHITE NOISE
-    seconds = 10
-    length_signal = Fs * seconds
-    signal = np.random.standard_normal(size=length_signal)
-    time = np.arange(0, len(signal) / Fs, Ts)
-
-    # CREATE RANDOM TIME INSTANTS
-    high_value = (length_signal - length_bubble) / Fs
-    instants = np.random.uniform(0, high_value, size=total_freqs)
-
-    # REPLACING BUBBLES IN THE SIGNAL
-    for i, item in enumerate(instants):
-        t = int(Fs * item)
-        signal[t: t + length_bubble] += np.asarray(bubbles[i])
+    seconds = args['seconds']
+    length_signal = int(Fs * seconds)
+
+    if not args['output']:
+        if length_signal < length_bubble:
+            print('ERROR! The signal must last at least {} seconds, the length of a bubble.'.
+                  format(length_bubble / Fs))
+            os.sys.exit(1)
+
+        # CREATE BUBBLES FROM RANDOM VALUES TAKEN IN EACH STAGE, AT THE RATE OF 10 SECONDS
+        counts = np.round(np.asarray(freqs_per_stage) * seconds / 10).astype(int)
+        bubbles, volumes = random_bubbles(dataset, counts, bub_time, rng)
+
+        # CREATE THE SIGNAL VECTOR WITH WHITE NOISE
+        signal = rng.standard_normal(size=length_signal)
+        time = np.arange(len(signal)) / Fs
+
+        # PLACING THE BUBBLES AT RANDOM TIME INSTANTS
+        high_value = (length_signal - length_bubble) / Fs
+        instants = rng.uniform(0, high_value, size=len(bubbles))
+        dsp.add_signals(signal, bubbles, (Fs * instants).astype(int))
+
+        # ESTIMATING LEAK
+        leak = np.sum(volumes) / seconds
+        print('Leak: {} mm^3/s'.format(np.round(leak, 2)))
+
+        # SHOW THE SIGNAL
+        plt.figure()
+        dsp.plot_signal(signal, time, 0)
+
+        plt.figure()
+        dsp.plot_spectrogram(signal, Fs, 0)
+
+        plt.show()
+        os.sys.exit(0)
+
+    # WRITING THE SIGNAL BLOCK BY BLOCK
+    block_size = max(int(Fs * args['block']), 1)
+    if args['output'].endswith('.npy'):
+        out = np.lib.format.open_memmap(args['output'], mode='w+', dtype=np.float64,
+                                        shape=(length_signal,))
+    else:
+        out = wave.open(args['output'], 'wb')
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(Fs)
+
+    # The tail of the bubbles that cross the end of a block goes to the next one
+    carry = np.zeros(length_bubble)
+    total_volume = 0
+
+    for offset in range(0, length_signal, block_size):
+        size = min(block_size, length_signal - offset)
+
+        # RANDOM NUMBER OF BUBBLES, KEEPING THE RATE OF EACH STAGE
+        counts = rng.poisson(np.asarray(freqs_per_stage) * size / (10 * Fs))
+        bubbles, volumes = random_bubbles(dataset, counts, bub_time, rng)
+        total_volume += np.sum(volumes)
+
+        signal = np.zeros(size + length_bubble)
+        signal[:size] = rng.standard_normal(size=size)
+        signal[:length_bubble] += carry
+        dsp.add_signals(signal, bubbles, rng.integers(0, size, size=len(bubbles)))
+        carry = signal[size:].copy()
+
+        if args['output'].endswith('.npy'):
+            out[offset:offset + size] = signal[:size]
+        else:
+            pcm = np.clip(np.round(signal[:size]), -2**15, 2**15 - 1).astype('<i2')
+            out.writeframes(pcm.tobytes())
+
+    if args['output'].endswith('.npy'):
+        out.flush()
+    else:
+        out.close()
 
     # ESTIMATING LEAK
-    leak = np.sum(volumes) / seconds
+    leak = total_volume / seconds
     print('Leak: {} mm^3/s'.format(np.round(leak, 2)))
-
-    # SHOW THE SIGNAL
-    plt.figure()
-    dsp.plot_signal(signal, time, 0)
-
-    plt.figure()
-    dsp.plot_spectrogram(signal, Fs, 0)
-
-    plt.show()
+    print('Signal saved in {}'.format(args['output']))
@@ -5,7 +5,8 @@ Dev: 	adejonghm
 ----------
 
 Used to separate each bubble that appears in the analyzed acoustic signal,
-in independent acoustic signals.
+in independent acoustic signals. With --output, the bubbles are taken block
+by block and saved in a .npy file, one bubble per row.
 """
 
 
@@ -17,10 +18,9 @@ import argparse
 # Third party imports
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import signal
-from scipy.io import wavfile
 
 # Local application imports
+import dsip.cache as dsc
 import dsip.sigproc as dsp
 
 
@@ -35,6 +35,12 @@ if __name__ == "__main__":
     #### CONSTRUCT ARGUMENT PARSE ####
     ap = argparse.ArgumentParser()
     ap.add_argument("-f", "--file", required=True, help="path to the input JSON file")
+    ap.add_argument("-b", "--block", type=int, default=2**20,
+                    help="number of samples read at once (default: 1048576)")
+    ap.add_argument("-o", "--output",
+                    help="path to the .npy file where the bubbles are saved, one per row")
+    ap.add_argument("--no-plot", action='store_true',
+                    help="print the start points instead of plotting the signal")
     args = vars(ap.parse_args())
     input_path = ''
 
@@ -44,6 +50,10 @@ if __name__ == "__main__":
         print('ERROR! JSON file not found.')
         os.sys.exit(1)
 
+    if args['output'] and not args['output'].endswith('.npy'):
+        print('ERROR! The output file must be a .npy file.')
+        os.sys.exit(1)
+
     #### READ JSON FILE ####
     with open(input_path, 'r', encoding='utf-8') as file:
         dataset = json.load(file)
@@ -61,25 +71,39 @@ if __name__ == "__main__":
     # audio_path = path + element['path'] + element['audioName']
     audio_path = path + element['path'] + element['audioCutted']
 
-    # .:: LOADING AUDIO FILE ::.
-    Fs, wave = wavfile.read(audio_path)
+    # .:: LOADING & FILTERING THE AUDIO FILE (CACHED, MEMORY-MAPPED) ::.
+    Fs, wave_filtered = dsc.get_filtered(audio_path, 15, 500, 'hp', block_size=args['block'])
 
     # .:: CUTTING SIGNAL THAT MATCHES THE VIDEO ::.
     # max_values = dsp.get_peaks(wave, size)
     # wave_cutted = wave[max_values[0]:max_values[-1]]
 
-    # .:: FILTERING THE SIGNAL ::.
-    sos = signal.butter(15, 500, 'hp', fs=Fs, output='sos')
-    wave_filtered = signal.sosfilt(sos, wave)
-
-    # .:: GETTING STAR OF EACH BUBBLE ::.
-    points = np.array(dsp.get_peaks(wave_filtered, size, max_value=1000))
+    # .:: GETTING STAR OF EACH BUBBLE, BLOCK BY BLOCK ::.
+    blocks = dsp.iter_blocks(wave_filtered, args['block'])
+    points = np.concatenate(list(dsp.stream_peaks(blocks, size, max_value=1000)) or
+                            [np.array([], dtype=int)])
     points = points[1:-1]
 
     # correcting start bubble
     correction = 321
     start_points = points - correction
 
+    # .:: SEPARATING THE BUBBLES, BLOCK BY BLOCK ::.
+    if args['output']:
+        starts = start_points[start_points >= 0]
+        bubbles = np.lib.format.open_memmap(args['output'], mode='w+',
+                                            dtype=wave_filtered.dtype, shape=(len(starts), size))
+        blocks = dsp.iter_blocks(wave_filtered, args['block'])
+        for i, (_, bubble) in enumerate(dsp.stream_bubbles(blocks, starts, size)):
+            bubbles[i, :len(bubble)] = bubble
+            bubbles[i, len(bubble):] = 0
+        bubbles.flush()
+        print('{} bubbles saved in {}'.format(len(starts), args['output']))
+
+    if args['no_plot']:
+        print(json.dumps(start_points.tolist()))
+        os.sys.exit(0)
+
     plt.xlabel('Segundos (s)')
     plt.ylabel('Amplitude')
     plt.ylim(-6500, 6500)
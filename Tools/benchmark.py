@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+"""
+Dev: 	adejonghm
+----------
+
+Micro-benchmarks of the hot functions of the dsip module, run on deterministic
+synthetic inputs of several sizes. The results are saved in a JSON file and
+two result files can be compared to flag the regressions.
+
+Example:
+  python benchmark.py -o before.json
+  python benchmark.py -o after.json --compare before.json
+"""
+
+# Standard library imports
+import argparse
+import json
+import os
+import platform
+from datetime import datetime
+from time import perf_counter
+
+# Third party imports
+import numpy as np
+
+# Local application imports
+from dsip import drlse
+from dsip import gfd
+from dsip import improc as dip
+from dsip import jilib as jm
+from dsip import sigproc as dsp
+from dsip import tracking
+
+
+def make_audio(seconds: float, fs: int = 48000, size: int = 4500) -> tuple:
+    """Create an acoustic signal with white noise and a bubble every 6000 samples.
+
+    Args:
+        seconds (float): Duration of the signal.
+        fs (int, optional): Sampling frequency. Defaults to 48000.
+        size (int, optional): Size of the bubble. Defaults to 4500.
+
+    Returns:
+        tuple: The signal and the starts of the bubbles.
+    """
+
+    rng = np.random.default_rng(0)
+    audio = rng.normal(0, 20, int(seconds * fs))
+    starts = np.arange(fs // 2, len(audio) - size, 6000)
+    bubbles = dsp.create_signals(rng.uniform(700, 1200, len(starts)), 0.05,
+                                 np.arange(size) / fs, 3000)
+    dsp.add_signals(audio, bubbles, starts)
+
+    return (audio, starts)
+
+
+def make_frame(side: int) -> tuple:
+    """Create a grayscale frame with an elliptic bubble over a noisy background.
+
+    Args:
+        side (int): Height and width of the frame.
+
+    Returns:
+        tuple: The frame, the background and the binary mask (0 or 255) of the bubble.
+    """
+
+    rng = np.random.default_rng(0)
+    background = rng.integers(20, 40, (side, side)).astype(np.uint8)
+    y, x = np.mgrid[:side, :side]
+    mask = (((x - side / 2) / (side / 8)) ** 2 + ((y - side / 2) / (side / 6)) ** 2 <= 1)
+    frame = background.copy()
+    frame[mask] += 120
+
+    return (frame, background, mask.astype(np.uint8) * 255)
+
+
+def get_benchmarks(quick: bool) -> dict:
+    """Build the benchmarks, each one as a function without arguments.
+
+    Args:
+        quick (bool): Use only the small inputs.
+
+    Returns:
+        dict: Functions to be timed, by name.
+    """
+
+    size = 4500
+    benchmarks = {}
+
+    audio_sizes = {'short': 10} if quick else {'short': 10, 'long': 600}
+    for label, seconds in audio_sizes.items():
+        audio, starts = make_audio(seconds)
+        benchmarks['sigproc.get_peaks[{}]'.format(label)] = (
+            lambda a=audio: dsp.get_peaks(a, size, max_value=1000))
+        benchmarks['sigproc.get_bubble[{}]'.format(label)] = (
+            lambda a=audio, s=starts: [dsp.get_bubble(a, b, size) for b in s])
+        benchmarks['sigproc.get_spectra[{}]'.format(label)] = (
+            lambda a=audio, s=starts: dsp.get_spectra(a, s, size))
+
+    frame_sizes = [256] if quick else [256, 1024]
+    for side in frame_sizes:
+        frame, background, mask = make_frame(side)
+        g = 1 / (1 + np.square(frame / 255.0))
+        phi = 2 * np.ones(frame.shape)
+        phi[side // 4:-side // 4, side // 4:-side // 4] = -2
+        square = dip.center_bubble(mask)
+
+        benchmarks['improc.subtract[{}]'.format(side)] = (
+            lambda f=frame, b=background: dip.subtract(f, b, thresh=15))
+        benchmarks['improc.get_bubble_volume[{}]'.format(side)] = (
+            lambda m=mask: dip.get_bubble_volume(m, 0.3846))
+        benchmarks['drlse.drlse_edge[{}]'.format(side)] = (
+            lambda p=phi, e=g: drlse.drlse_edge(p, e, 10, 0.1, 2.0, 2, 5, 'double-well', 2))
+        engine = drlse.DRLSE(frame.shape, 10, 0.1, 2.0, 2, 'double-well', 2, band=6)
+        engine.set_edge_indicator(g)
+        benchmarks['drlse.DRLSE.band[{}]'.format(side)] = (
+            lambda p=phi, e=engine: e.evolve(p.copy(), 5))
+        benchmarks['gfd.generic_fourier_descriptor[{}]'.format(side)] = (
+            lambda s=square: gfd.generic_fourier_descriptor(s, 4, 9))
+        benchmarks['gfd.generic_fourier_descriptors[{}x64]'.format(side)] = (
+            lambda s=np.stack([square] * 64): gfd.generic_fourier_descriptors(s, 4, 9))
+
+    def track(frames: int = 1000):
+        tracker = tracking.BubbleTracker()
+        for f in range(frames):
+            y = 180 - 9 * (f % 20)
+            tracker.update(f, [[100, y]], [[y - 10, y + 10, 90, 110]], [300])
+        return tracker.tracks(30)
+
+    benchmarks['tracking.BubbleTracker[1000]'] = track
+
+    nodes = [{'path': 'd{}/'.format(i), 'diameter': i, 'bubblesStart': list(range(100))}
+             for i in range(1000)]
+    benchmarks['jilib.add_node'] = lambda: jm.add_node(nodes, {'test': 100}, 100)
+    benchmarks['jilib.add_item'] = lambda: jm.add_item(nodes, 'test', 100)
+    benchmarks['jilib.rename_item'] = (
+        lambda: jm.rename_item(jm.rename_item(nodes, 'diameter', 'd'), 'd', 'diameter'))
+
+    return benchmarks
+
+
+def measure(function, repeat: int, min_time: float = 0.2) -> dict:
+    """Time a function, calling it as many times as needed to last at least `min_time`.
+
+    Args:
+        function (callable): Function without arguments.
+        repeat (int): Number of measurements.
+        min_time (float, optional): Minimum duration of a measurement in seconds. Defaults to 0.2.
+
+    Returns:
+        dict: Best and mean time of a call in seconds, and the number of calls per measurement.
+    """
+
+    start = perf_counter()
+    function()
+    elapsed = perf_counter() - start
+    number = max(1, int(min_time / max(elapsed, 1e-9)))
+
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        for _ in range(number):
+            function()
+        times.append((perf_counter() - start) / number)
+
+    return {'best': min(times), 'mean': float(np.mean(times)), 'number': number}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Compare the results with a baseline, using the best time of each benchmark.
+
+    Args:
+        results (dict): Results of the current run.
+        baseline (dict): Results of a previous run.
+        tolerance (float): Allowed slowdown, e.g. 0.2 for 20%.
+
+    Returns:
+        list: Names of the benchmarks that regressed.
+    """
+
+    regressions = []
+    print('\n{:<45} {:>12} {:>12} {:>8}'.format('Benchmark', 'Before [ms]', 'After [ms]', 'Ratio'))
+    print('-' * 80)
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['best'], result['best']
+        ratio = after / before
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('{:<45} {:>12.3f} {:>12.3f} {:>8.2f}{}'.format(
+            name, before * 1e3, after * 1e3, ratio, flag))
+
+    return regressions
+
+
+if __name__ == "__main__":
+
+    #### CONSTRUCT ARGUMENT PARSE ####
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-o", "--output", default='benchmark.json',
+                    help="path to the output JSON file (default: benchmark.json)")
+    ap.add_argument("-c", "--compare", help="path to a previous JSON file to compare with")
+    ap.add_argument("-t", "--tolerance", type=float, default=0.2,
+                    help="allowed slowdown before flagging a regression (default: 0.2)")
+    ap.add_argument("-r", "--repeat", type=int, default=5,
+                    help="number of measurements of each benchmark (default: 5)")
+    ap.add_argument("-k", "--filter", default='',
+                    help="run only the benchmarks whose name contains this text")
+    ap.add_argument("-q", "--quick", action='store_true', help="use only the small inputs")
+    args = vars(ap.parse_args())
+
+    if args['compare'] and not os.path.exists(args['compare']):
+        print('ERROR! JSON file not found.')
+        os.sys.exit(1)
+
+    #### RUNNING THE BENCHMARKS ####
+    results = {}
+    for name, function in get_benchmarks(args['quick']).items():
+        if args['filter'] not in name:
+            continue
+        results[name] = measure(function, args['repeat'])
+        print('{:<45} {:>12.3f} ms'.format(name, results[name]['best'] * 1e3))
+
+    data = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.platform(),
+        'results': results
+    }
+    with open(args['output'], 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent=2, separators=(',', ':'))
+    print('*SAVED*')
+
+    #### COMPARING WITH A PREVIOUS RUN ####
+    if args['compare']:
+        with open(args['compare'], 'r', encoding='utf-8') as file:
+            baseline = json.load(file)['results']
+
+        regressions = compare(results, baseline, args['tolerance'])
+        if regressions:
+            print('\n{} regression(s) found.'.format(len(regressions)))
+            os.sys.exit(1)
@@ -8,5 +8,5 @@ Init file
 # Standard library imports
 
 
-__all__ = ['drlse', 'gfd', 'improc', 'jilib', 'sigproc']
+__all__ = ['cache', 'drlse', 'frames', 'gfd', 'improc', 'jilib', 'masks', 'sigproc', 'tracking']
 __authors__ = 'adejonghm'
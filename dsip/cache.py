@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+"""
+Dev: 	adejonghm
+----------
+
+Content-addressed cache of the filtered acoustic signals. Each filtered signal
+is saved as a `.npy` file named after the contents of the audio file and the
+specification of the filter, so repeated analyses over the same recordings
+load it memory-mapped instead of filtering again.
+
+The cache folder is taken from the DSIP_CACHE environment variable
+(default: ~/.cache/dsip) and its size is limited by DSIP_CACHE_SIZE, in bytes
+(default: 4 GiB). The least recently used files are removed first, and so are
+the temporary files left by interrupted runs, after a day.
+"""
+
+# Standard library imports
+import hashlib
+import json
+import os
+import time
+
+# Third party imports
+import numpy as np
+from scipy import signal
+from scipy.io import wavfile
+
+# Local application imports
+from dsip import sigproc as dsp
+
+
+CACHE_DIR = os.environ.get('DSIP_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'dsip'))
+MAX_SIZE = int(os.environ.get('DSIP_CACHE_SIZE', 4 * 2**30))
+TEMP_MAX_AGE = 24 * 3600
+
+
+def file_hash(path: str, chunk_size: int = 2**20) -> str:
+    """Calculate the SHA-256 digest of the contents of a file.
+
+    Args:
+        path (str): Path of the file.
+        chunk_size (int, optional): Number of bytes read at once. Defaults to 2**20.
+
+    Returns:
+        str: Hexadecimal digest of the file.
+    """
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def evict(cache_dir: str, max_size: int, keep: str = None):
+    """Remove the least recently used files until the cache fits in its size,
+    and the temporary files not modified for TEMP_MAX_AGE seconds.
+
+    Args:
+        cache_dir (str): Path of the cache folder.
+        max_size (int): Maximum size of the cache in bytes.
+        keep (str, optional): File that must not be removed. Defaults to None.
+    """
+
+    entries = []
+    now = time.time()
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith('.npy'):
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        elif name.endswith('.tmp') and now - os.stat(path).st_mtime > TEMP_MAX_AGE:
+            # Left by a run that was interrupted while filtering
+            os.remove(path)
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        if path != keep:
+            os.remove(path)
+            total -= size
+
+
+def get_filtered(audio_path: str, order: int, band, btype: str, cache_dir: str = None,
+                 max_size: int = None, block_size: int = 2**20) -> tuple:
+    """Filter an audio file with a Butterworth filter, using the cache.
+    The parameters of the filter are the ones of `signal.butter`.
+
+    Args:
+        audio_path (str): Path of the WAV file.
+        order (int): Order of the filter.
+        band (float or tuple): Critical frequency or frequencies of the filter.
+        btype (str): Type of filter, e.g. 'hp' or 'bandpass'.
+        cache_dir (str, optional): Path of the cache folder. Defaults to CACHE_DIR.
+        max_size (int, optional): Maximum size of the cache in bytes. Defaults to MAX_SIZE.
+        block_size (int, optional): Number of samples filtered at once. Defaults to 2**20.
+
+    Returns:
+        tuple: The sampling frequency and the filtered signal (memory-mapped, read only),
+               with one column per channel when the file has several.
+    """
+
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    max_size = MAX_SIZE if max_size is None else max_size
+    os.makedirs(cache_dir, exist_ok=True)
+
+    fs, wave = wavfile.read(audio_path, mmap=True)
+    spec = {
+        'audio': file_hash(audio_path),
+        'order': order,
+        'band': np.atleast_1d(band).tolist(),
+        'btype': btype,
+        'fs': fs
+    }
+    key = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+    path = os.path.join(cache_dir, key + '.npy')
+
+    if os.path.exists(path):
+        # Mark the file as recently used
+        os.utime(path)
+        return (fs, np.load(path, mmap_mode='r'))
+
+    # FILTERING BLOCK BY BLOCK DIRECTLY INTO THE CACHE FILE
+    sos = signal.butter(order, band, btype, fs=fs, output='sos')
+    temp_path = path + '.{}.tmp'.format(os.getpid())
+    try:
+        filtered = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.float64,
+                                             shape=wave.shape)
+        for offset, block in dsp.filter_blocks(dsp.iter_blocks(wave, block_size), sos):
+            filtered[offset:offset + len(block)] = block
+        filtered.flush()
+        del filtered
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    evict(cache_dir, max_size, keep=path)
+
+    return (fs, np.load(path, mmap_mode='r'))
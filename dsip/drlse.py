@@ -92,6 +92,415 @@ def neumannBound(f):
     return g
 
 
+def _gradient_x(f, out):
+    """ Derivative along the columns, as np.gradient, written in a given array """
+
+    np.subtract(f[:, 2:], f[:, :-2], out=out[:, 1:-1])
+    out[:, 1:-1] /= 2.0
+    np.subtract(f[:, 1], f[:, 0], out=out[:, 0])
+    np.subtract(f[:, -1], f[:, -2], out=out[:, -1])
+
+    return out
+
+
+def _gradient_y(f, out):
+    """ Derivative along the rows, as np.gradient, written in a given array """
+
+    np.subtract(f[2:], f[:-2], out=out[1:-1])
+    out[1:-1] /= 2.0
+    np.subtract(f[1], f[0], out=out[0])
+    np.subtract(f[-1], f[-2], out=out[-1])
+
+    return out
+
+
+def _neumann_bound(f):
+    """ Make a function satisfy Neumann boundary condition, in place """
+
+    [ny, nx] = f.shape
+
+    f[0, 0] = f[2, 2]
+    f[0, nx-1] = f[2, nx-3]
+    f[ny-1, 0] = f[ny-3, 2]
+    f[ny-1, nx-1] = f[ny-3, nx-3]
+
+    f[0, 1:-1] = f[2, 1:-1]
+    f[ny-1, 1:-1] = f[ny-3, 1:-1]
+
+    f[1:-1, 0] = f[1:-1, 2]
+    f[1:-1, nx-1] = f[1:-1, nx-3]
+
+    return f
+
+
+def _stencil(idx, shape):
+    """ Neighbours and weights of the derivatives of np.gradient at the given flat indices """
+
+    [ny, nx] = shape
+    row, col = np.divmod(idx, nx)
+
+    up = np.where(row > 0, idx - nx, idx)
+    down = np.where(row < ny - 1, idx + nx, idx)
+    wy = np.where((row > 0) & (row < ny - 1), 0.5, 1.0)
+    left = np.where(col > 0, idx - 1, idx)
+    right = np.where(col < nx - 1, idx + 1, idx)
+    wx = np.where((col > 0) & (col < nx - 1), 0.5, 1.0)
+
+    return (up, down, wy, left, right, wx)
+
+
+def _wrap_stencil(idx, shape):
+    """ Neighbours of the laplacian with periodic boundary at the given flat indices """
+
+    [ny, nx] = shape
+    row, col = np.divmod(idx, nx)
+
+    up = np.where(row > 0, idx - nx, idx + (ny - 1) * nx)
+    down = np.where(row < ny - 1, idx + nx, idx - (ny - 1) * nx)
+    left = np.where(col > 0, idx - 1, idx + nx - 1)
+    right = np.where(col < nx - 1, idx + 1, idx - nx + 1)
+
+    return (up, down, left, right)
+
+
+def shift_level_set(phi, dx, dy, c, margin=0):
+    """Binary step level set function whose region (phi < 0) is the one of `phi`
+    moved (dx, dy) pixels, used to start the evolution of a frame from the
+    contour found in the previous one. The region can be grown by a margin, so
+    that it still encloses the object when the displacement is not exact.
+
+    Args:
+        phi: level set function of the previous frame.
+        dx: displacement along the columns, rounded to whole pixels.
+        dy: displacement along the rows, rounded to whole pixels.
+        c: value of the binary step function, positive.
+        margin (int, optional): pixels added around the region. Defaults to 0.
+
+    Returns:
+        The new initial level set function.
+    """
+
+    [ny, nx] = phi.shape
+    dx = int(np.clip(round(dx), -nx, nx))
+    dy = int(np.clip(round(dy), -ny, ny))
+
+    init = np.full(phi.shape, c, dtype=phi.dtype)
+    moved = init[max(dy, 0):ny - max(-dy, 0), max(dx, 0):nx - max(-dx, 0)]
+    moved[phi[max(-dy, 0):ny - max(dy, 0), max(-dx, 0):nx - max(dx, 0)] < 0] = -c
+
+    if margin > 0:
+        init = filters.minimum_filter(init, size=2 * margin + 1, mode='nearest')
+
+    return init
+
+
+class DRLSE:
+    """Edge-based DRLSE engine for frames of a given shape. All the work arrays
+    are allocated once and the level set function evolves in place, so the
+    same engine can be used for every frame of a video, calling
+    `set_edge_indicator` for each new frame.
+
+    Args:
+        shape (tuple): Shape of the frames.
+        lmda: weight of the weighted length term.
+        mu: weight of distance regularization term.
+        epsilon: width of Dirac Delta function.
+        timestep: time step.
+        potentialFunction: 'single-well' or 'double-well', see `drlse_edge`.
+        alpha (int, optional): weight of the weighted area term. Defaults to 0.
+        dtype (optional): type of the work arrays, np.float64 or np.float32.
+                          Defaults to np.float64.
+        band (int, optional): half width in pixels of the narrow band around the zero
+                              level where the level set is updated, 0 to update the
+                              whole image. Defaults to 0.
+        rebuild (int, optional): iterations between two rebuilds of the narrow band.
+                                 Defaults to 5.
+    """
+
+    def __init__(self, shape, lmda, mu, epsilon, timestep, potentialFunction, alpha=0,
+                 dtype=np.float64, band=0, rebuild=5):
+
+        if potentialFunction not in ('single-well', 'double-well'):
+            raise ValueError('Wrong choice of potential function. Please input the '
+                             'string "single-well" or "double-well".')
+
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.lmda = lmda
+        self.mu = mu
+        self.epsilon = epsilon
+        self.timestep = timestep
+        self.potentialFunction = potentialFunction
+        self.alpha = alpha
+        self.band = band
+        self.rebuild = max(int(rebuild), 1)
+
+        # EDGE INDICATOR FUNCTION AND ITS GRADIENT
+        self.g = np.zeros(self.shape, self.dtype)
+        self.vx = np.zeros(self.shape, self.dtype)
+        self.vy = np.zeros(self.shape, self.dtype)
+
+        # WORK ARRAYS
+        self.phi_x = np.empty(self.shape, self.dtype)
+        self.phi_y = np.empty(self.shape, self.dtype)
+        self.s = np.empty(self.shape, self.dtype)
+        self.Nx = np.empty(self.shape, self.dtype)
+        self.Ny = np.empty(self.shape, self.dtype)
+        self.curvature = np.empty(self.shape, self.dtype)
+        self.diracPhi = np.empty(self.shape, self.dtype)
+        self.tmp = [np.empty(self.shape, self.dtype) for _ in range(4)]
+        self.mask = [np.empty(self.shape, bool) for _ in range(2)]
+        self.sign = [np.empty(self.shape, bool) for _ in range(2)]
+
+    def set_edge_indicator(self, g):
+        """Set the edge indicator function of a new frame and precompute its gradient.
+
+        Args:
+            g: edge indicator function.
+        """
+
+        np.copyto(self.g, g, casting='same_kind')
+        _gradient_y(self.g, self.vy)
+        _gradient_x(self.g, self.vx)
+
+    def _dist_reg_p2(self, phi, out):
+        """ Distance regularization term with the double-well potential p2, see distReg_p2 """
+
+        s = self.s
+        dps, den, lap = self.tmp[1:]
+        mask = self.mask[0]
+
+        # ps = a * sin(2*pi*s) / (2*pi) + b * (s - 1)
+        np.multiply(s, 2 * np.pi, out=dps)
+        np.sin(dps, out=dps)
+        dps /= 2 * np.pi
+        np.subtract(s, 1, out=den)
+        np.greater(s, 1, out=mask)
+        np.copyto(dps, den, where=mask)
+
+        # dps = ps / s, with ps == 0 -> 1 and s == 0 -> 1
+        np.equal(dps, 0, out=mask)
+        np.copyto(dps, 1, where=mask)
+        np.equal(s, 0, out=mask)
+        np.copyto(den, s)
+        np.copyto(den, 1, where=mask)
+        dps /= den
+
+        # div(dps * phi_x - phi_x, dps * phi_y - phi_y) + laplace(phi)
+        np.multiply(dps, self.phi_x, out=den)
+        den -= self.phi_x
+        _gradient_x(den, out)
+        np.multiply(dps, self.phi_y, out=den)
+        den -= self.phi_y
+        _gradient_y(den, lap)
+        out += lap
+        filters.laplace(phi, output=lap, mode='wrap')
+        out += lap
+
+        return out
+
+    def evolve(self, phi, iters, alpha=None):
+        """Update the level set function, in place.
+
+        Args:
+            phi: level set function to be updated by level set evolution.
+                 It is updated in place when its type is the one of the engine.
+            iters: number of iterations.
+            alpha (optional): weight of the weighted area term. Defaults to the
+                              one given to the engine.
+
+        Returns:
+            The updated level set function.
+        """
+
+        alpha = self.alpha if alpha is None else alpha
+        phi = np.asarray(phi)
+        if phi.dtype != self.dtype:
+            phi = phi.astype(self.dtype)
+        if self.band:
+            return self._evolve_band(np.ascontiguousarray(phi), iters, alpha)
+
+        phi_x, phi_y, s, Nx, Ny = self.phi_x, self.phi_y, self.s, self.Nx, self.Ny
+        curvature, diracPhi = self.curvature, self.diracPhi
+        distRegTerm, edgeTerm, areaTerm, _ = self.tmp
+        inside, below = self.mask
+        smallNumber = 1e-10
+
+        for _ in range(iters):
+            _neumann_bound(phi)
+            _gradient_y(phi, phi_y)
+            _gradient_x(phi, phi_x)
+
+            np.square(phi_x, out=s)
+            np.square(phi_y, out=distRegTerm)
+            s += distRegTerm
+            np.sqrt(s, out=s)
+
+            # add a small positive number to avoid division by zero
+            np.add(s, smallNumber, out=distRegTerm)
+            np.divide(phi_x, distRegTerm, out=Nx)
+            np.divide(phi_y, distRegTerm, out=Ny)
+            _gradient_x(Nx, curvature)
+            _gradient_y(Ny, distRegTerm)
+            curvature += distRegTerm
+
+            # compute the distance regularization term in equation (13)
+            if self.potentialFunction == 'single-well':
+                filters.laplace(phi, output=distRegTerm, mode='wrap')
+                distRegTerm -= curvature
+            else:
+                self._dist_reg_p2(phi, distRegTerm)
+
+            # dirac(phi, epsilon)
+            np.multiply(phi, np.pi, out=diracPhi)
+            diracPhi /= self.epsilon
+            np.cos(diracPhi, out=diracPhi)
+            diracPhi += 1
+            diracPhi *= 1 / 2 / self.epsilon
+            np.less_equal(phi, self.epsilon, out=inside)
+            np.greater_equal(phi, -self.epsilon, out=below)
+            inside &= below
+            diracPhi *= inside
+
+            # balloon/pressure force
+            np.multiply(diracPhi, self.g, out=areaTerm)
+            np.multiply(self.vx, Nx, out=edgeTerm)
+            np.multiply(self.vy, Ny, out=Nx)
+            edgeTerm += Nx
+            edgeTerm *= diracPhi
+            np.multiply(areaTerm, curvature, out=Nx)
+            edgeTerm += Nx
+
+            # phi = phi + timestep * (mu * distRegTerm + lmda * edgeTerm + alpha * areaTerm)
+            distRegTerm *= self.mu
+            edgeTerm *= self.lmda
+            distRegTerm += edgeTerm
+            areaTerm *= alpha
+            distRegTerm += areaTerm
+            distRegTerm *= self.timestep
+            phi += distRegTerm
+
+        return phi
+
+    def _get_band(self, phi):
+        """ Flat indices of the narrow band and of the band grown by one pixel """
+
+        neg = phi < 0
+        seeds = np.zeros(phi.shape, bool)
+        changes = neg[:, 1:] != neg[:, :-1]
+        seeds[:, 1:] |= changes
+        seeds[:, :-1] |= changes
+        changes = neg[1:] != neg[:-1]
+        seeds[1:] |= changes
+        seeds[:-1] |= changes
+
+        # THE BAND IS GROWN ONLY INSIDE THE BOUNDING BOX OF THE ZERO LEVEL
+        band = np.zeros(phi.shape, bool)
+        grown = np.zeros(phi.shape, bool)
+        rows = np.flatnonzero(seeds.any(axis=1))
+        cols = np.flatnonzero(seeds.any(axis=0))
+        if len(rows):
+            margin = self.band + 1
+            box = (slice(max(rows[0] - margin, 0), rows[-1] + margin + 1),
+                   slice(max(cols[0] - margin, 0), cols[-1] + margin + 1))
+            filters.maximum_filter(seeds[box], size=2 * self.band + 1, output=band[box],
+                                   mode='constant')
+            filters.maximum_filter(seeds[box], size=2 * self.band + 3, output=grown[box],
+                                   mode='constant')
+
+        return (np.flatnonzero(band), np.flatnonzero(grown))
+
+    def _evolve_band(self, phi, iters, alpha):
+        """ Update the level set function only in a narrow band around the zero level """
+
+        f = phi.reshape(-1)
+        g, vx, vy = self.g.reshape(-1), self.vx.reshape(-1), self.vy.reshape(-1)
+        Nx, Ny = self.Nx.reshape(-1), self.Ny.reshape(-1)
+        phi_x, phi_y = self.phi_x.reshape(-1), self.phi_y.reshape(-1)
+        ax, ay = self.tmp[0].reshape(-1), self.tmp[1].reshape(-1)
+        smallNumber = 1e-10
+
+        for i in range(iters):
+            if i % self.rebuild == 0:
+                (idx, grown) = self._get_band(phi)
+                stencil = _stencil(idx, self.shape)
+                grown_stencil = _stencil(grown, self.shape)
+                wrap = _wrap_stencil(idx, self.shape)
+
+            _neumann_bound(phi)
+
+            # GRADIENT AND NORMAL ON THE GROWN BAND, NEEDED BY THE DIVERGENCES ON THE BAND
+            up, down, wy, left, right, wx = grown_stencil
+            gy = (f[down] - f[up]) * wy
+            gx = (f[right] - f[left]) * wx
+            s = np.sqrt(np.square(gx) + np.square(gy))
+            phi_x[grown], phi_y[grown] = gx, gy
+            Nx[grown] = gx / (s + smallNumber)
+            Ny[grown] = gy / (s + smallNumber)
+            if self.potentialFunction == 'double-well':
+                ps = np.where(s <= 1, np.sin(2 * np.pi * s) / (2 * np.pi), s - 1)
+                dps = np.where(ps != 0, ps, 1) / np.where(s != 0, s, 1)
+                ax[grown] = dps * gx - gx
+                ay[grown] = dps * gy - gy
+
+            # TERMS OF THE EVOLUTION ON THE BAND
+            up, down, wy, left, right, wx = stencil
+            curvature = (Nx[right] - Nx[left]) * wx + (Ny[down] - Ny[up]) * wy
+            f0 = f[idx]
+            laplacian = (f[wrap[0]] - 2 * f0 + f[wrap[1]]) + (f[wrap[2]] - 2 * f0 + f[wrap[3]])
+            if self.potentialFunction == 'single-well':
+                distRegTerm = laplacian - curvature
+            else:
+                distRegTerm = (ax[right] - ax[left]) * wx + (ay[down] - ay[up]) * wy + laplacian
+
+            diracPhi = (1 / 2 / self.epsilon) * (1 + np.cos(np.pi * f0 / self.epsilon))
+            diracPhi *= (f0 <= self.epsilon) & (f0 >= -self.epsilon)
+            areaTerm = diracPhi * g[idx]
+            edgeTerm = diracPhi * (vx[idx] * Nx[idx] + vy[idx] * Ny[idx]) + areaTerm * curvature
+            f[idx] = f0 + self.timestep * (self.mu * distRegTerm + self.lmda * edgeTerm +
+                                           alpha * areaTerm)
+
+        return phi
+
+    def run(self, phi, iter_inner, max_outer, tol=0, alpha=None):
+        """Evolve the level set function in outer loops of `iter_inner` iterations
+        until the zero level contour stops moving, i.e. until the number of pixels
+        whose sign changed in an outer loop is not greater than `tol`.
+
+        Args:
+            phi: level set function to be updated by level set evolution.
+            iter_inner: number of iterations of each outer loop.
+            max_outer: maximum number of outer loops.
+            tol (int, optional): pixels allowed to change of side of the contour
+                                 in a converged outer loop. Defaults to 0.
+            alpha (optional): weight of the weighted area term. Defaults to the
+                              one given to the engine.
+
+        Returns:
+            tuple: The updated level set function and the number of outer loops done.
+        """
+
+        previous, current = self.sign
+        phi = np.asarray(phi)
+        if phi.dtype != self.dtype:
+            phi = phi.astype(self.dtype)
+        np.less(phi, 0, out=previous)
+
+        k = 0
+        while k < max_outer:
+            phi = self.evolve(phi, iter_inner, alpha)
+            k += 1
+
+            np.less(phi, 0, out=current)
+            np.not_equal(previous, current, out=previous)
+            changed = np.count_nonzero(previous)
+            previous, current = current, previous
+            if changed <= tol:
+                break
+
+        return (phi, k)
+
+
 def drlse_edge(phi_0, g, lmda, mu, epsilon, timestep, iters, potentialFunction, alpha=0):
     """Updated Level Set Function
 
@@ -111,35 +520,7 @@ def drlse_edge(phi_0, g, lmda, mu, epsilon, timestep, iters, potentialFunction,
         alpha (int, optional): weight of the weighted area term. Defaults to 0.
     """
 
-    phi = phi_0.copy()
-    [vy, vx] = np.gradient(g)
+    engine = DRLSE(phi_0.shape, lmda, mu, epsilon, timestep, potentialFunction, alpha)
+    engine.set_edge_indicator(g)
 
-    i = 0
-    while i < iters:
-        phi = neumannBound(phi)
-        [phi_y, phi_x] = np.gradient(phi)
-        s = np.sqrt(np.square(phi_x) + np.square(phi_y))
-        smallNumber = 1e-10
-        # add a small positive number to avoid division by zero
-        Nx = phi_x / (s + smallNumber)
-        Ny = phi_y / (s + smallNumber)
-        curvature = div(Nx, Ny)
-        if potentialFunction == 'single-well':
-            # compute distance regularization term
-            # in equation (13) with the single-well potential p1.
-            distRegTerm = filters.laplace(phi, mode='wrap') - curvature
-        elif potentialFunction == 'double-well':
-            # compute the distance regularization term
-            # in eqaution (13) with the double-well potential p2.
-            distRegTerm = distReg_p2(phi)
-        else:
-            print('Error: Wrong choice of potential function. Please input the'
-                  'string "single-well" or "double-well" in the drlse_edge function.')
-        diracPhi = dirac(phi, epsilon)
-        areaTerm = diracPhi * g  # balloon/pressure force
-        edgeTerm = diracPhi * (vx * Nx + vy * Ny) + diracPhi * g * curvature
-        phi = phi + timestep * (mu * distRegTerm + lmda * edgeTerm + alpha * areaTerm)
-
-        i += 1
-
-    return phi
+    return engine.evolve(np.array(phi_0, dtype=np.float64), iters)
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+
+"""
+Dev: 	adejonghm
+----------
+
+Sources of the frames of a recording, read directly from the video, from a
+folder of images or from a frame store. The frames of a video are decoded
+ahead by a background thread into a bounded queue, so the decoding overlaps
+the processing.
+
+A frame store is a folder with all the frames in one raw file of uint8, used
+memory-mapped as an (n, h, w) array, and a JSON header with the shape, the
+fps, the source and the timestamp of each frame.
+
+Example:
+  frames = open_frames('node.avi', gray=True)
+  for index, frame in frames[100:200]:
+      ...
+"""
+
+# Standard library imports
+import json
+import os
+import threading
+from queue import Empty, Full, Queue
+
+# Third party imports
+import cv2 as cv
+import numpy as np
+
+
+VIDEO_FORMATS = ('.avi', '.mp4')
+STORE_HEADER = 'header.json'
+STORE_DATA = 'frames.raw'
+
+
+class VideoFrames:
+    """Frames of a video, decoded by a background thread while they are used.
+
+    Args:
+        path (str): Path of the video (.avi or .mp4).
+        gray (bool, optional): Convert the frames to grayscale. Defaults to True.
+        start (int, optional): First frame. Defaults to 0.
+        stop (int, optional): Frame after the last one. Defaults to the end of the video.
+        queue_size (int, optional): Frames decoded ahead. Defaults to 64.
+    """
+
+    def __init__(self, path: str, gray: bool = True, start: int = 0, stop: int = None,
+                 queue_size: int = 64):
+
+        video = cv.VideoCapture(path)
+        if not video.isOpened():
+            raise IOError('Video {} could not be opened.'.format(path))
+
+        self.path = path
+        self.gray = gray
+        self.fps = video.get(cv.CAP_PROP_FPS)
+        self.total = int(video.get(cv.CAP_PROP_FRAME_COUNT))
+        self.shape = (int(video.get(cv.CAP_PROP_FRAME_HEIGHT)),
+                      int(video.get(cv.CAP_PROP_FRAME_WIDTH)))
+        self.start, self.stop, _ = slice(start, stop).indices(self.total)
+        self.queue_size = queue_size
+        video.release()
+
+    def __len__(self) -> int:
+        return max(self.stop - self.start, 0)
+
+    def __getitem__(self, key):
+        """A frame by its position in the range, or a new source with a range of frames."""
+
+        frames = range(self.start, self.stop)[key]
+        if isinstance(key, slice):
+            if frames.step != 1:
+                raise ValueError('Only contiguous ranges of frames are supported.')
+            return VideoFrames(self.path, self.gray, frames.start, frames.stop, self.queue_size)
+
+        for _, frame in VideoFrames(self.path, self.gray, frames, frames + 1, 1):
+            return frame
+        raise IndexError('Frame {} could not be decoded.'.format(key))
+
+    def name(self, index: int) -> str:
+        """Name of a frame, its number starting at 1 with zeros on the left."""
+
+        return str(index + 1).zfill(len(str(self.total)))
+
+    def _decode(self, queue: Queue, stop: threading.Event):
+        """ Read the frames in the background, until the end or until it is stopped """
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return
+                except Full:
+                    continue
+
+        video = cv.VideoCapture(self.path)
+        try:
+            if self.start:
+                video.set(cv.CAP_PROP_POS_FRAMES, self.start)
+            for index in range(self.start, self.stop):
+                if stop.is_set():
+                    break
+                ok, frame = video.read()
+                if not ok:
+                    break
+                if self.gray and frame.ndim == 3:
+                    frame = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+                put((index, frame))
+        except Exception as error:  # pylint: disable=broad-except
+            put(error)
+        finally:
+            video.release()
+            put(None)
+
+    def __iter__(self):
+        """Yield (index, frame) pairs, in order, with the index of the frame in the video."""
+
+        queue = Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._decode, args=(queue, stop), daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                item = queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            try:
+                while True:
+                    queue.get_nowait()
+            except Empty:
+                pass
+            thread.join()
+
+
+class FolderFrames:
+    """Frames saved as images in a folder, in the order of their names.
+
+    Args:
+        path (str): Path of the folder.
+        gray (bool, optional): Read the frames in grayscale. Defaults to True.
+        names (list, optional): Files of the frames. Defaults to all the images of the folder.
+    """
+
+    def __init__(self, path: str, gray: bool = True, names: list = None):
+
+        self.path = path
+        self.gray = gray
+        self.names = names if names is not None else \
+            sorted(name for name in os.listdir(path) if name.endswith(('.jpg', '.png', '.bmp')))
+        self.fps = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, key):
+        """A frame by its index, or a new source with a range of frames."""
+
+        if isinstance(key, slice):
+            return FolderFrames(self.path, self.gray, self.names[key])
+
+        return cv.imread(os.path.join(self.path, self.names[key]), 0 if self.gray else 1)
+
+    def name(self, index: int) -> str:
+        """Name of a frame, the name of its file without the extension."""
+
+        return os.path.splitext(self.names[index])[0]
+
+    def __iter__(self):
+        """Yield (index, frame) pairs, in order."""
+
+        for index in range(len(self.names)):
+            yield (index, self[index])
+
+
+class FrameStore:
+    """Frames of a frame store, memory-mapped. Taking a frame or a range of frames
+    does not copy them, except to convert color frames to grayscale.
+
+    Args:
+        path (str): Path of the folder of the store.
+        gray (bool, optional): Give the frames in grayscale. Defaults to True.
+        start (int, optional): First frame. Defaults to 0.
+        stop (int, optional): Frame after the last one. Defaults to the last frame.
+    """
+
+    def __init__(self, path: str, gray: bool = True, start: int = 0, stop: int = None):
+
+        with open(os.path.join(path, STORE_HEADER), 'r', encoding='utf-8') as file:
+            self.header = json.load(file)
+
+        shape = tuple(self.header['shape'])
+        if shape[0]:
+            data = np.memmap(os.path.join(path, STORE_DATA), dtype=self.header['dtype'],
+                             mode='r', shape=shape)
+        else:
+            data = np.empty(shape, dtype=self.header['dtype'])
+
+        self.path = path
+        self.gray = gray
+        self.fps = self.header['fps']
+        self.total = shape[0]
+        self.start, self.stop, _ = slice(start, stop).indices(self.total)
+        self.frames = data[self.start:self.stop]
+        self.timestamps = self.header['timestamps'][self.start:self.stop]
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __getitem__(self, key):
+        """A frame by its position in the range, or a new store with a range of frames."""
+
+        if isinstance(key, slice):
+            frames = range(self.start, self.stop)[key]
+            if frames.step != 1:
+                raise ValueError('Only contiguous ranges of frames are supported.')
+            return FrameStore(self.path, self.gray, frames.start, frames.stop)
+
+        frame = self.frames[key]
+        if self.gray and frame.ndim == 3:
+            frame = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+        return frame
+
+    def name(self, index: int) -> str:
+        """Name of a frame, its number starting at 1 with zeros on the left."""
+
+        return str(index + 1).zfill(len(str(self.total)))
+
+    def __iter__(self):
+        """Yield (index, frame) pairs, in order, with the index of the frame in the store."""
+
+        for i in range(len(self.frames)):
+            yield (self.start + i, self[i])
+
+
+class FrameStoreWriter:
+    """Write the frames of a recording in a frame store, one after the other. The
+    header is written when it is closed, so an incomplete store can not be read.
+    Used with `with`, a store interrupted by an error is removed instead.
+
+    Args:
+        path (str): Path of the folder of the store.
+        fps (float): Frames per second of the recording.
+        source (str, optional): Recording the frames come from. Defaults to None.
+    """
+
+    def __init__(self, path: str, fps: float, source: str = None):
+
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.fps = fps
+        self.source = source
+        self.shape = None
+        self.count = 0
+        self.timestamps = []
+
+        # THE HEADER OF A PREVIOUS STORE WOULD DESCRIBE THE NEW FRAMES
+        if os.path.exists(os.path.join(path, STORE_HEADER)):
+            os.remove(os.path.join(path, STORE_HEADER))
+        self.file = open(os.path.join(path, STORE_DATA), 'wb')
+
+    def append(self, frame: np.ndarray, timestamp: float = None):
+        """Add a frame at the end of the store.
+
+        Args:
+            frame (np.ndarray): Frame of uint8, with the same shape as the others.
+            timestamp (float, optional): Time of the frame in seconds.
+                                         Defaults to its number divided by the fps.
+        """
+
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if self.shape is None:
+            self.shape = frame.shape
+        elif frame.shape != self.shape:
+            raise ValueError('Frame of shape {} in a store of frames of shape {}.'.
+                             format(frame.shape, self.shape))
+
+        self.file.write(frame.tobytes())
+        self.timestamps.append(self.count / self.fps if timestamp is None else timestamp)
+        self.count += 1
+
+    def close(self):
+        """Close the raw file and write the header."""
+
+        self.file.close()
+        header = {
+            'shape': [self.count] + list(self.shape or (0, 0)),
+            'dtype': 'uint8',
+            'fps': self.fps,
+            'source': self.source,
+            'timestamps': self.timestamps
+        }
+        with open(os.path.join(self.path, STORE_HEADER), 'w', encoding='utf-8') as file:
+            json.dump(header, file)
+
+    def abort(self):
+        """Close the raw file and remove it, without writing the header."""
+
+        self.file.close()
+        os.remove(os.path.join(self.path, STORE_DATA))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_frame_store(video_path: str, path: str, gray: bool = True) -> int:
+    """Decode a video into a frame store.
+
+    Args:
+        video_path (str): Path of the video.
+        path (str): Path of the folder of the store.
+        gray (bool, optional): Save the frames in grayscale. Defaults to True.
+
+    Returns:
+        int: Number of frames saved.
+    """
+
+    frames = VideoFrames(video_path, gray)
+    with FrameStoreWriter(path, frames.fps, source=os.path.abspath(video_path)) as store:
+        for index, frame in frames:
+            store.append(frame, index / frames.fps)
+
+    return store.count
+
+
+def open_frames(path: str, gray: bool = True, **kwargs):
+    """Open the frames of a recording, from a video, a frame store or a folder of images.
+
+    Args:
+        path (str): Path of the video or of the folder.
+        gray (bool, optional): Use the frames in grayscale. Defaults to True.
+
+    Returns:
+        VideoFrames, FrameStore or FolderFrames: The source of the frames.
+    """
+
+    if path.lower().endswith(VIDEO_FORMATS):
+        return VideoFrames(path, gray, **kwargs)
+
+    if os.path.exists(os.path.join(path, STORE_HEADER)):
+        return FrameStore(path, gray, **kwargs)
+
+    return FolderFrames(path, gray, **kwargs)
@@ -10,6 +10,7 @@ D. Zhang & G. Lu, Shape based image retrieval using generic Fourier Descriptors,
 """
 
 # Standard library imports
+from functools import lru_cache
 from math import sqrt, pi
 
 # Third party imports
@@ -18,25 +19,23 @@ import numpy as np
 # Local application imports
 
 
-def generic_fourier_descriptor(bw, m, n):
-    """[summary]
+# Largest basis kept in the cache, in bytes. The bases of larger images are
+# built and used by parts of this size, without keeping them.
+MAX_BASIS_BYTES = 64 * 2**20
+
+
+def get_polar_grid(N):
+    """Normalized radius and angle of each pixel of the N x N images, around the center.
 
     Args:
-        bw ([type]): [description]
-        m ([type]): [description]
-        n ([type]): [description]
+        N (int): Side of the images.
 
     Returns:
-        [type]: [description]
+        tuple: The radius and the angle of the pixels, flattened, and the maximal radius.
     """
-    if len(bw.shape) > 2:
-        bw = bw.max(axis=2) / 255
-
-    N = bw.shape[1]
 
     # GET THE MAXIMAL RADIUS MAXR
     maxRad = sqrt((N // 2)**2 + (N // 2)**2)
-    # Determinar el maximo de maxRad
 
     # MESHGRID WITH ORIGIN CENTERED TO THE IMAGE CENTER
     x = np.linspace(-(N-1) // 2, (N-1) // 2, N)
@@ -50,30 +49,117 @@ def generic_fourier_descriptor(bw, m, n):
     theta = np.arctan2(Y, X)
     theta[theta < 0] = theta[theta < 0] + 2 + pi
 
-    # INITIALIZE VARIABLES
-    FR = np.zeros((m, n))
-    FI = np.zeros((m, n))
-    FD = np.zeros((m*n, 1))
-
-    i = 0
-    # LOOP OVER ALL RADIAL FREQUENCIES
-    for rad in range(m):
-
-        # LOOP OVER ALL ANGULAR FREQUENCIES
-        for ang in range(n):
-
-            # CALCULATE FR AND FI FOR (RAD,ANG)
-            tempR = bw * np.cos(2*pi * rad * radius + ang * theta)
-            tempI = -bw * np.sin(2*pi * rad * radius + ang * theta)
-            FR[rad, ang] = np.sum(tempR)
-            FI[rad, ang] = np.sum(tempI)
-
-            # CALCULATE FD, WHERE FD(END)=FD(0,0) --> RAD == 0 & ANG == 0
-            if rad == 0 and ang == 0:
-                # NORMALIZED BY CIRCLE AREA
-                FD[i] = sqrt(FR[0, 0]**2 + FR[0, 0]**2) / (pi * maxRad**2)
-            else:
-                # NORMALIZED BY |FD(0,0)|
-                FD[i] = sqrt(FR[rad, ang]**2 + FI[rad, ang]**2) / sqrt(FR[0, 0]**2 + FR[0, 0]**2)
-            i += 1
-    return FD
+    return (radius.ravel(), theta.ravel(), maxRad)
+
+
+def get_basis_rows(radius, theta, m, n, rows):
+    """Rows of the polar Fourier basis: the first m*n rows are the cosines of the
+    (rad, ang) frequencies and the last ones the sines, with the minus sign of the
+    imaginary part.
+
+    Args:
+        radius (ndarray): Normalized radius of each pixel.
+        theta (ndarray): Angle of each pixel.
+        m (int): Number of radial frequencies.
+        n (int): Number of angular frequencies.
+        rows (slice): Rows of the basis, in range(2*m*n).
+
+    Returns:
+        ndarray: The rows of the basis, one column per pixel.
+    """
+
+    # PHASE OF EACH (RAD, ANG) FREQUENCY IN EACH PIXEL
+    index = np.arange(2 * m * n)[rows]
+    freq = index % (m * n)
+    rad = (freq // n)[:, np.newaxis]
+    ang = (freq % n)[:, np.newaxis]
+    cosine = index < m * n
+
+    # EACH ROW IS EITHER A COSINE OR A SINE, ONLY THAT ONE IS COMPUTED
+    basis = np.empty((len(index),) + np.shape(radius))
+    basis[cosine] = np.cos(2*pi * rad[cosine] * radius + ang[cosine] * theta)
+    basis[~cosine] = -np.sin(2*pi * rad[~cosine] * radius + ang[~cosine] * theta)
+
+    return basis
+
+
+@lru_cache(maxsize=4)
+def get_basis(N, m, n):
+    """Polar Fourier basis of the N x N images, built once for each (N, m, n) and
+    kept in a small cache. Each row is a (rad, ang) frequency and each column a
+    pixel, see `get_basis_rows`. Only used for bases up to MAX_BASIS_BYTES, so the
+    cache holds at most 4 of them.
+
+    Args:
+        N (int): Side of the images.
+        m (int): Number of radial frequencies.
+        n (int): Number of angular frequencies.
+
+    Returns:
+        tuple: The basis (read only), shape (2*m*n, N*N), and the maximal radius.
+    """
+
+    radius, theta, maxRad = get_polar_grid(N)
+    basis = get_basis_rows(radius, theta, m, n, slice(None))
+    basis.setflags(write=False)
+
+    return (basis, maxRad)
+
+
+def generic_fourier_descriptors(masks, m, n):
+    """Generic Fourier Descriptors of a batch of centered square masks, with one
+    matrix product over the cached polar basis. For large images the basis is not
+    cached and the product is done by parts of at most MAX_BASIS_BYTES.
+
+    Args:
+        masks (ndarray): Stack of masks (n_masks, N, N), or one mask (N, N).
+        m (int): Number of radial frequencies.
+        n (int): Number of angular frequencies.
+
+    Returns:
+        ndarray: Descriptors, shape (n_masks, m*n), or (m*n,) for one mask, where
+                 the first one is FD(0,0) normalized by the circle area and the
+                 others are normalized by |FD(0,0)|.
+    """
+
+    masks = np.asarray(masks, dtype=np.float64)
+    N = masks.shape[-1]
+    flat = masks.reshape(-1, N * N)
+
+    # FR AND FI OF ALL THE FREQUENCIES OF ALL THE MASKS
+    if 2 * m * n * N * N * 8 <= MAX_BASIS_BYTES:
+        basis, maxRad = get_basis(N, m, n)
+        F = flat @ basis.T
+    else:
+        radius, theta, maxRad = get_polar_grid(N)
+        F = np.empty((len(flat), 2 * m * n))
+        step = max(MAX_BASIS_BYTES // (N * N * 8), 1)
+        for i in range(0, 2 * m * n, step):
+            rows = slice(i, min(i + step, 2 * m * n))
+            F[:, rows] = flat @ get_basis_rows(radius, theta, m, n, rows).T
+    FR, FI = F[:, :m * n], F[:, m * n:]
+
+    # CALCULATE FD, WHERE FD(0) --> RAD == 0 & ANG == 0
+    norm = np.sqrt(FR[:, :1]**2 + FR[:, :1]**2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        FD = np.sqrt(FR**2 + FI**2) / norm
+    FD[:, 0] = norm[:, 0] / (pi * maxRad**2)
+
+    return FD.reshape(masks.shape[:-2] + (m * n,))
+
+
+def generic_fourier_descriptor(bw, m, n):
+    """Generic Fourier Descriptors of a centered square image.
+
+    Args:
+        bw (ndarray): Binary image, square, with one or three chanels.
+        m (int): Number of radial frequencies.
+        n (int): Number of angular frequencies.
+
+    Returns:
+        ndarray: Descriptors as a column, shape (m*n, 1).
+    """
+    if len(bw.shape) > 2:
+        bw = bw.max(axis=2) / 255
+
+    return generic_fourier_descriptors(bw, m, n).reshape(m * n, 1)
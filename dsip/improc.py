@@ -10,7 +10,6 @@ the image processing performed.
 """
 
 # Standard library imports
-from math import pi
 
 # Third party imports
 import cv2 as cv
@@ -60,58 +59,138 @@ def get_centroid(image: np.ndarray) -> tuple:
     return (cX, cY)
 
 
-def get_main_bubble(image: np.ndarray, flag: bool, iteration: int) -> tuple:
+class FrameAnalysis:
+    """Connected components of the objects (pixels greater than a level) of an
+    image, labeled once. The statistics of the components are computed with
+    the labels and kept, to be used by the functions that select or count
+    the objects, instead of extracting the contours again in each one.
+
+    Args:
+        image (ndarray): Image with one chanel.
+        level (float, optional): Value over which a pixel belongs to an object. Defaults to 0.
+    """
+
+    def __init__(self, image: np.ndarray, level: float = 0):
+
+        mask = (np.asarray(image) > level).astype(np.uint8)
+        count, labels, stats, centroids = cv.connectedComponentsWithStats(mask, connectivity=4)
+
+        self.shape = mask.shape
+        self.count = count - 1
+        self.labels = labels
+        self.areas = stats[1:, cv.CC_STAT_AREA]
+        self.bboxes = stats[1:, :4]
+        self.centroids = centroids[1:]
+        self._perimeters = None
+
+    @property
+    def perimeters(self) -> np.ndarray:
+        """Approximate length of the contour of each component, as the number of
+        background pixels next to it (4-neighbours). For a single object without holes
+        away from the border of the image, it is the number of points of its contour
+        given by `measure.find_contours` at level 0, without the point that closes it.
+        Objects touching the border or each other, or with holes, give other values."""
+
+        if self._perimeters is None:
+            # ONLY THE BOX THAT CONTAINS ALL THE OBJECTS, AND ITS BORDER, IS NEEDED
+            labels = self.labels
+            if self.count:
+                x, y = self.bboxes[:, 0], self.bboxes[:, 1]
+                x_end = self.bboxes[:, 0] + self.bboxes[:, 2]
+                y_end = self.bboxes[:, 1] + self.bboxes[:, 3]
+                labels = labels[max(y.min() - 1, 0):y_end.max() + 1,
+                                max(x.min() - 1, 0):x_end.max() + 1]
+
+            padded = np.pad(labels, 1)
+            neighbours = [padded[:-2, 1:-1], padded[2:, 1:-1], padded[1:-1, :-2], padded[1:-1, 2:]]
+            background = labels == 0
+
+            # EACH BACKGROUND PIXEL IS COUNTED ONCE FOR EACH COMPONENT IT TOUCHES
+            perimeters = np.zeros(self.count + 1, np.int64)
+            for i, neighbour in enumerate(neighbours):
+                counted = background & (neighbour > 0)
+                for previous in neighbours[:i]:
+                    counted &= neighbour != previous
+                perimeters += np.bincount(neighbour[counted], minlength=self.count + 1)
+            self._perimeters = perimeters[1:]
+
+        return self._perimeters
+
+    def largest(self) -> int:
+        """Get the component with the longest contour.
+
+        Returns:
+            int: Index of the component, or -1 when there is no object.
+        """
+
+        return int(np.argmax(self.perimeters)) if self.count else -1
+
+    def get_bbox(self, index: int) -> tuple:
+        """Get the bounding box of a component.
+
+        Args:
+            index (int): Index of the component.
+
+        Returns:
+            tuple: First row, last row + 1, first column and last column + 1.
+        """
+
+        x, y, w, h = self.bboxes[index]
+        return (int(y), int(y + h), int(x), int(x + w))
+
+
+def get_main_bubble(image: np.ndarray, flag: bool, iteration: int, offset: int = 0,
+                    analysis: FrameAnalysis = None) -> tuple:
     """Select the main bubble in the image based on its size.
 
     Args:
         image (ndarray): Grayscale Image with one channel.
         flag (bool): Selector to decide which bubble is taken.
         iteration (int): The number of the bubble used to rename the M image.
+        offset (int, optional): Row of the frame where the image starts, when it is
+                                a crop of the frame. Defaults to 0.
+        analysis (FrameAnalysis, optional): Components of the image. Defaults to None.
 
     Returns:
         ndarray: A new image with the main object.
     """
 
-    contours = measure.find_contours(image, 0)
-    lengths = [len(item) for i, item in enumerate(contours)]
-    index = lengths.index(max(lengths))
+    analysis = FrameAnalysis(image) if analysis is None else analysis
+    new_image = np.zeros_like(image)
+    if not analysis.count:
+        return (iteration, flag, new_image)
 
     # GET THE OBJECT
-    bub = contours[index].astype(int)
-    y_min, y_max = min(bub[:, 0]), max(bub[:, 0])
-    x_min, x_max = min(bub[:, 1]), max(bub[:, 1])
+    y_min, y_max, x_min, x_max = analysis.get_bbox(analysis.largest())
 
     # RELEASING THE FLAG WHEN THE BUBBLE REACHES THE TOP
-    lengths = [len(item) for i, item in enumerate(contours)]
-
-    y_min, y_max = int(min(contours[0][:, 0])), int(max(contours[0][:, 0]))
-    if flag and y_min < 8:
+    if flag and y_min + offset <= 8:
         flag = False
 
     # INCREASING THE NUMBER OF THE BUBBLE WHEN IT STARTS AGAIN
-    if not flag and y_max >= 190:
+    if not flag and y_max + offset >= 190:
         iteration += 1
         flag = True
 
     # CREATE THE NEW IMAGE WITH THE OBJECT
-    new_image = np.zeros_like(image)
     new_image[y_min:y_max, x_min:x_max] = image[y_min:y_max, x_min:x_max]
 
     return (iteration, flag, new_image)
 
 
-def get_number_of_bubble(image: np.ndarray) -> int:
+def get_number_of_bubble(image: np.ndarray, analysis: FrameAnalysis = None) -> int:
     """Get the number of bubbles in a image
 
     Args:
         image (ndarray): Grayscale input image with a single channel.
+        analysis (FrameAnalysis, optional): Components of the image. Defaults to None.
 
     Returns:
         int: Number of bubble in the image.
     """
 
-    contours = measure.find_contours(image, 0)
-    return len(contours)
+    analysis = FrameAnalysis(image) if analysis is None else analysis
+    return analysis.count
 
 
 def get_bubble_volume(image: np.ndarray, scale_factor: float) -> float:
@@ -127,13 +206,80 @@ def get_bubble_volume(image: np.ndarray, scale_factor: float) -> float:
         float: Volume of the bubble.
     """
 
-    volume = 0
-    for px in range(image.shape[0]):
-        if 255 in image[px]:
-            radius = (np.count_nonzero(image[px] == 255) / 2) * scale_factor
-            volume += pi * (radius ** 2) * scale_factor
+    volumes, _ = get_bubble_volumes(np.asarray(image) == 255, scale_factor)
+    return float(volumes)
+
+
+def get_bubble_volumes(masks: np.ndarray, scale_factor: float, subpixel: bool = False,
+                       level: float = 127.5) -> tuple:
+    """Calculate the volume of revolution of the bubble in a mask or in each mask of a
+    stack (n_masks, height, width), with the width of each row as the diameter of a disc
+    of height scale_factor. The widths are the number of object pixels (non zero) of the
+    rows or, with subpixel, the distance between the first and the last crossing of the
+    contour at the given level in each row, interpolated between pixels.
+
+    Args:
+        masks (ndarray): Mask or stack of masks with one chanel.
+        scale_factor (float): Convection value of 1 pixel in millimeters.
+        subpixel (bool, optional): Use the width of the contour. Defaults to False.
+        level (float, optional): Level of the contour in subpixel mode. Defaults to 127.5.
+
+    Returns:
+        tuple: Volumes and radii of the spheres with the same volumes, as arrays with
+               one value per mask.
+    """
+
+    masks = np.asarray(masks)
 
-    return volume
+    if not subpixel:
+        widths = np.count_nonzero(masks, axis=-1)
+    else:
+        values = masks.astype(np.float64)
+        inside = values >= level
+        found = inside.any(axis=-1)
+        width = masks.shape[-1]
+
+        # FIRST AND LAST PIXEL OF EACH ROW OVER THE LEVEL, AND THEIR OUTER NEIGHBOURS
+        first = np.argmax(inside, axis=-1)[..., np.newaxis]
+        last = width - 1 - np.argmax(inside[..., ::-1], axis=-1)[..., np.newaxis]
+        v_first = np.take_along_axis(values, first, axis=-1)
+        v_before = np.take_along_axis(values, np.maximum(first - 1, 0), axis=-1)
+        v_last = np.take_along_axis(values, last, axis=-1)
+        v_after = np.take_along_axis(values, np.minimum(last + 1, width - 1), axis=-1)
+
+        # CROSSINGS OF THE LEVEL, HALF A PIXEL OUT AT THE BORDERS OF THE IMAGE
+        with np.errstate(divide='ignore', invalid='ignore'):
+            left = np.where(first > 0, first - 1 + (level - v_before) / (v_first - v_before),
+                            -0.5)
+            right = np.where(last < width - 1, last + (v_last - level) / (v_last - v_after),
+                             width - 0.5)
+        widths = np.where(found, (right - left)[..., 0], 0)
+
+    volumes = np.pi * np.sum(np.square(widths * (scale_factor / 2)), axis=-1) * scale_factor
+    radii = np.cbrt((3 * volumes) / (4 * np.pi))
+
+    return (volumes, radii)
+
+
+def get_roi(coord: list, shape: tuple, margin: int = 0) -> tuple:
+    """Get the region of interest of an image: the flow area grown by a margin.
+
+    Args:
+        coord (list): Coordinates of the flow area (y_min, y_max, x_min, x_max).
+        shape (tuple): Shape of the image.
+        margin (int, optional): Pixels added around the flow area. Defaults to 0.
+
+    Returns:
+        tuple: The slices of the region in the image, and the coordinates
+               of the flow area inside the region.
+    """
+
+    y_min, y_max, x_min, x_max = coord[0], coord[1], coord[2], coord[3]
+    rows = slice(max(y_min - margin, 0), min(y_max + margin, shape[0]))
+    cols = slice(max(x_min - margin, 0), min(x_max + margin, shape[1]))
+    inner = [y_min - rows.start, y_max - rows.start, x_min - cols.start, x_max - cols.start]
+
+    return ((rows, cols), inner)
 
 
 def clean_image(image: np.ndarray, coord: list, sigmaX: float) -> np.ndarray:
@@ -151,9 +297,8 @@ def clean_image(image: np.ndarray, coord: list, sigmaX: float) -> np.ndarray:
     # APPLY GUASSIAN BLUR
     smoothed_image = cv.GaussianBlur(image, (5, 5), sigmaX)
 
-    # FIND CONTOURS
-    contours = measure.find_contours(smoothed_image, 0)
-    lengths = [len(item) for i, item in enumerate(contours)]
+    # FIND THE OBJECTS
+    analysis = FrameAnalysis(smoothed_image)
 
     # CREATE NEW IMAGE WITH MAIN BUBBLE
     new_image = np.zeros_like(image)
@@ -161,7 +306,8 @@ def clean_image(image: np.ndarray, coord: list, sigmaX: float) -> np.ndarray:
     # GET DELIMITERS FROM THE FLOW AREA
     y_min, y_max, x_min, x_max = coord[0], coord[1], coord[2], coord[3]
 
-    if any(i >= 70 for i in lengths):
+    # CONTOURS OF 70 POINTS OR MORE
+    if np.any(analysis.perimeters >= 69):
         new_image[y_min:y_max, x_min:x_max] = image[y_min:y_max, x_min:x_max]
         new_image = cv.GaussianBlur(new_image, (5, 5), sigmaX)
     else:
@@ -170,18 +316,19 @@ def clean_image(image: np.ndarray, coord: list, sigmaX: float) -> np.ndarray:
     return new_image
 
 
-def detect_bubble(image: np.ndarray) -> int:
+def detect_bubble(image: np.ndarray, analysis: FrameAnalysis = None) -> int:
     """Determine the number of object on the image.
 
     Args:
         image (ndarray): Image with one chanel.
+        analysis (FrameAnalysis, optional): Components of the image. Defaults to None.
 
     Returns:
         int: Number of object on the image.
     """
 
-    number_of_obj = len(measure.find_contours(image, 0))
-    return 0 if number_of_obj == 0 else number_of_obj
+    analysis = FrameAnalysis(image) if analysis is None else analysis
+    return analysis.count
 
 
 def center_bubble(image: np.ndarray) -> np.ndarray:
@@ -240,29 +387,44 @@ def center_bubble(image: np.ndarray) -> np.ndarray:
     return square_fig
 
 
-def subtract(image1: np.ndarray, image2: np.ndarray, thresh: int) -> np.ndarray:
+def subtract(image1: np.ndarray, image2: np.ndarray, thresh: int, out: np.ndarray = None,
+             chunk: int = 64) -> np.ndarray:
     """Subtract (image1 - image2) pixel by pixel that has the same
-    dimensions, putting zero where the result is less than 20.
+    dimensions, putting zero where the result is less than the threshold.
+    A stack of frames (n_frames, height, width) can be given as image1,
+    to be subtracted from the same image2 (e.g. the background) in one call.
 
     Args:
-        image1 (ndarray): Image to be subtract.
+        image1 (ndarray): Image or stack of images to be subtract.
         image2 (ndarray): Image to be subtract.
         thresh (int): Value used as a threshold in subtraction to put zero on the result.
+        out (ndarray, optional): Preallocated uint8 array where the result is saved.
+                                 Defaults to None.
+        chunk (int, optional): Number of frames of a stack subtracted at once,
+                               to bound the temporary memory. Defaults to 64.
 
     Returns:
         ndarray: Image with zeros in negative values.
     """
 
-    row_len, col_len = image1.shape
-    result = np.zeros_like(image1, np.uint8)
+    image1, image2 = np.asarray(image1), np.asarray(image2)
+    if out is None:
+        out = np.empty(np.broadcast_shapes(image1.shape, image2.shape), np.uint8)
 
-    for row in range(row_len):
-        for col in range(col_len):
-            num = float(image1[row, col]) - float(image2[row, col])
+    if image1.ndim == 3 and len(image1) > chunk:
+        for i in range(0, len(image1), chunk):
+            subtract(image1[i:i + chunk], image2, thresh, out=out[i:i + chunk], chunk=chunk)
+        return out
 
-            if num < thresh:
-                result[row, col] = 0
-            else:
-                result[row, col] = num
+    # 8-BIT IMAGES ARE SUBTRACTED EXACTLY IN 16 BITS, ANY OTHER TYPE IN FLOAT
+    if image1.dtype.itemsize == 1 and image2.dtype.itemsize == 1 and \
+            np.issubdtype(image1.dtype, np.integer) and np.issubdtype(image2.dtype, np.integer):
+        dtype = np.int16
+    else:
+        dtype = np.float64
+
+    num = np.subtract(image1, image2, dtype=dtype)
+    np.copyto(out, num, casting='unsafe')
+    out[num < thresh] = 0
 
-    return result
+    return out
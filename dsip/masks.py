@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+
+"""
+Dev: 	adejonghm
+----------
+
+Exact storage of the binary masks of the bubbles segmented in a node. Each mask
+is cropped to the bounding box of the bubble and packed with `np.packbits`
+(8 pixels per byte), and all the masks of the node are kept in one `.npz` file,
+with the bubble, the frame and the bounding box of each mask. The masks are read
+back bit-exactly, without decoding images.
+
+The index of the bubbles is saved next to the store as a JSON file: for each
+bubble, its frames in order with their names, bounding boxes and areas. It is
+enough to find the frames of a bubble without reading the masks.
+
+Example:
+  with MaskStoreWriter('masks.npz', (190, 320)) as writer:
+      writer.add(bubble, frame, name, bw_image)
+  write_index('bubbles.json', writer.index())
+
+  store = MaskStore('masks.npz')
+  (frames, masks) = store.masks(bubble)
+  frames = load_index('bubbles.json')[bubble]['frames']
+"""
+
+# Standard library imports
+import json
+import os
+
+# Third party imports
+import numpy as np
+
+
+MASKS_FILE = 'masks.npz'
+INDEX_FILE = 'bubbles.json'
+
+
+def pack_mask(mask: np.ndarray) -> tuple:
+    """Crop a mask to the bounding box of its object pixels and pack its bits.
+
+    Args:
+        mask (np.ndarray): Mask with one chanel, the object pixels are the non zero ones.
+
+    Returns:
+        tuple: The bounding box (y_min, y_max, x_min, x_max), with the max excluded,
+               the number of object pixels and the packed bits (uint8).
+    """
+
+    mask = np.asarray(mask) != 0
+    rows = np.flatnonzero(mask.any(axis=1))
+    if not len(rows):
+        return ((0, 0, 0, 0), 0, np.empty(0, dtype=np.uint8))
+
+    cols = np.flatnonzero(mask.any(axis=0))
+    bbox = (int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1)
+    crop = mask[bbox[0]:bbox[1], bbox[2]:bbox[3]]
+
+    return (bbox, int(np.count_nonzero(crop)), np.packbits(crop, axis=None))
+
+
+def unpack_mask(bits: np.ndarray, bbox: tuple, shape: tuple, out: np.ndarray = None) -> np.ndarray:
+    """Rebuild a mask from its packed bits and its bounding box.
+
+    Args:
+        bits (np.ndarray): Packed bits of the mask, cropped to the bounding box.
+        bbox (tuple): Bounding box (y_min, y_max, x_min, x_max), with the max excluded.
+        shape (tuple): Shape of the mask.
+        out (np.ndarray, optional): Boolean array of the shape where the mask is written.
+                                    Defaults to a new one.
+
+    Returns:
+        np.ndarray: Boolean mask.
+    """
+
+    (y_min, y_max, x_min, x_max) = bbox
+    if out is None:
+        out = np.zeros(shape, dtype=bool)
+    else:
+        out[...] = False
+
+    size = (y_max - y_min) * (x_max - x_min)
+    if size:
+        crop = np.unpackbits(bits, count=size).reshape(y_max - y_min, x_max - x_min)
+        out[y_min:y_max, x_min:x_max] = crop.view(bool)
+
+    return out
+
+
+def build_index(bubbles, frames, names, bboxes, areas) -> dict:
+    """Group the masks of a node by bubble, in the order of the frames.
+
+    Args:
+        bubbles (array_like): Number of the bubble of each mask.
+        frames (array_like): Index of the frame of each mask.
+        names (array_like): Name of the frame of each mask.
+        bboxes (array_like): Bounding box (y_min, y_max, x_min, x_max) of each mask.
+        areas (array_like): Number of pixels of each mask.
+
+    Returns:
+        dict: For each bubble, the positions of its masks and the lists of their
+              frames, names, bounding boxes and areas.
+    """
+
+    bubbles = np.asarray(bubbles, dtype=np.int64)
+    frames = np.asarray(frames, dtype=np.int64)
+    order = np.lexsort((frames, bubbles))
+    ids, starts = np.unique(bubbles[order], return_index=True)
+
+    index = {}
+    for bubble, positions in zip(ids.tolist(), np.split(order, starts[1:])):
+        index[bubble] = {
+            'positions': positions,
+            'frames': frames[positions].tolist(),
+            'names': [str(names[i]) for i in positions],
+            'bboxes': [[int(n) for n in bboxes[i]] for i in positions],
+            'areas': [int(areas[i]) for i in positions]
+        }
+
+    return index
+
+
+def write_index(path: str, index: dict):
+    """Save the index of the bubbles as a JSON file.
+
+    Args:
+        path (str): Path of the JSON file.
+        index (dict): Index made by `build_index`.
+    """
+
+    data = {str(bubble): {key: value for key, value in entry.items() if key != 'positions'}
+            for bubble, entry in index.items()}
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, separators=(',', ':'))
+
+
+def load_index(path: str) -> dict:
+    """Load the index of the bubbles saved by `write_index`.
+
+    Args:
+        path (str): Path of the JSON file.
+
+    Returns:
+        dict: For each bubble (int), the lists of its frames, names, bounding boxes and areas.
+    """
+
+    with open(path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+
+    return {int(bubble): entry for bubble, entry in data.items()}
+
+
+class MaskStoreWriter:
+    """Collect the masks of a node and write them in a mask store when it is closed.
+
+    Args:
+        path (str): Path of the .npz file.
+        shape (tuple): Shape of the masks.
+    """
+
+    def __init__(self, path: str, shape: tuple):
+
+        self.path = path
+        self.shape = tuple(shape)
+        self.bubbles = []
+        self.frames = []
+        self.names = []
+        self.bboxes = []
+        self.areas = []
+        self.bits = []
+
+    def add(self, bubble: int, frame: int, name: str, mask: np.ndarray):
+        """Add the mask of a bubble in a frame.
+
+        Args:
+            bubble (int): Number of the bubble.
+            frame (int): Index of the frame.
+            name (str): Name of the frame.
+            mask (np.ndarray): Mask of the bubble, with the shape of the store.
+        """
+
+        if mask.shape != self.shape:
+            raise ValueError('Mask of shape {} in a store of masks of shape {}.'.
+                             format(mask.shape, self.shape))
+
+        (bbox, area, bits) = pack_mask(mask)
+        self.bubbles.append(bubble)
+        self.frames.append(frame)
+        self.names.append(name)
+        self.bboxes.append(bbox)
+        self.areas.append(area)
+        self.bits.append(bits)
+
+    def index(self) -> dict:
+        """Index of the bubbles added so far, see `build_index`."""
+
+        return build_index(self.bubbles, self.frames, self.names,
+                           np.reshape(self.bboxes, (-1, 4)), self.areas)
+
+    def temp_path(self) -> str:
+        """Path of the temporary file where the store is written before it is renamed."""
+
+        return self.path + '.{}.tmp.npz'.format(os.getpid())
+
+    def close(self):
+        """Write the store, in a temporary file first so an incomplete one is never read."""
+
+        sizes = [len(bits) for bits in self.bits]
+        offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+
+        try:
+            np.savez(self.temp_path(),
+                     shape=np.array(self.shape, dtype=np.int64),
+                     bubbles=np.array(self.bubbles, dtype=np.int64),
+                     frames=np.array(self.frames, dtype=np.int64),
+                     names=np.array(self.names, dtype=str),
+                     bboxes=np.array(self.bboxes, dtype=np.int64).reshape(-1, 4),
+                     areas=np.array(self.areas, dtype=np.int64),
+                     offsets=offsets,
+                     bits=np.concatenate(self.bits) if self.bits else np.empty(0, dtype=np.uint8))
+        except BaseException:
+            self.abort()
+            raise
+        os.replace(self.temp_path(), self.path)
+
+    def abort(self):
+        """Drop the masks collected and remove the temporary file, without writing the store."""
+
+        for values in (self.bubbles, self.frames, self.names, self.bboxes, self.areas, self.bits):
+            values.clear()
+        if os.path.exists(self.temp_path()):
+            os.remove(self.temp_path())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class MaskStore:
+    """Masks of a node read from a mask store, keyed by (bubble, frame).
+
+    Args:
+        path (str): Path of the .npz file.
+    """
+
+    def __init__(self, path: str):
+
+        with np.load(path) as data:
+            self.shape = tuple(int(n) for n in data['shape'])
+            self.bubbles = data['bubbles']
+            self.frames = data['frames']
+            self.names = data['names']
+            self.bboxes = data['bboxes']
+            self.areas = data['areas']
+            self.offsets = data['offsets']
+            self.bits = data['bits']
+
+        self.path = path
+        self.keys = {(int(b), int(f)): i for i, (b, f) in enumerate(zip(self.bubbles, self.frames))}
+        self.index = build_index(self.bubbles, self.frames, self.names, self.bboxes, self.areas)
+
+    def __len__(self) -> int:
+        return len(self.bubbles)
+
+    def __contains__(self, key: tuple) -> bool:
+        return tuple(key) in self.keys
+
+    def ids(self) -> np.ndarray:
+        """Numbers of the bubbles of the store, in increasing order."""
+
+        return np.array(list(self.index), dtype=np.int64)
+
+    def mask(self, i: int, out: np.ndarray = None) -> np.ndarray:
+        """Mask of the i-th entry of the store.
+
+        Args:
+            i (int): Position of the mask in the store.
+            out (np.ndarray, optional): Boolean array where the mask is written.
+                                        Defaults to a new one.
+
+        Returns:
+            np.ndarray: Boolean mask.
+        """
+
+        bits = self.bits[self.offsets[i]:self.offsets[i + 1]]
+
+        return unpack_mask(bits, self.bboxes[i], self.shape, out)
+
+    def get(self, bubble: int, frame: int) -> np.ndarray:
+        """Mask of a bubble in a frame.
+
+        Args:
+            bubble (int): Number of the bubble.
+            frame (int): Index of the frame.
+
+        Returns:
+            np.ndarray: Boolean mask.
+        """
+
+        if (bubble, frame) not in self.keys:
+            raise KeyError('No mask of bubble {} in frame {}.'.format(bubble, frame))
+
+        return self.mask(self.keys[(bubble, frame)])
+
+    def masks(self, bubble: int) -> tuple:
+        """All the masks of a bubble, in the order of the frames.
+
+        Args:
+            bubble (int): Number of the bubble.
+
+        Returns:
+            tuple: The indices of the frames and the masks as a boolean stack
+                   (n_frames, height, width).
+        """
+
+        if bubble not in self.index:
+            return (np.empty(0, dtype=np.int64), np.zeros((0,) + self.shape, dtype=bool))
+
+        positions = self.index[bubble]['positions']
+        stack = np.zeros((len(positions),) + self.shape, dtype=bool)
+        for j, i in enumerate(positions):
+            self.mask(i, stack[j])
+
+        return (self.frames[positions], stack)
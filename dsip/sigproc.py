@@ -11,26 +11,22 @@ the digital signal processing performed.
 
 # Standard library imports
 import os
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from math import pi
+from time import sleep
 
 # Third party imports
 import numpy as np
-from matplotlib import animation
 from matplotlib import pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.ticker import FuncFormatter
+from scipy import signal
 from scipy.io import wavfile
 from tqdm import tqdm
 
 
-def clear():
-    """Clear the terminal"""
-
-    if os.name == 'nt':
-        _ = os.system('cls')
-    else:
-        _ = os.system('clear')
-
-
 def get_bubble(audio: np.ndarray, start: int, size: int, fs: int = 48000) -> tuple:
     """Selects a specific bubble of the audio, from its start and duration.
 
@@ -50,26 +46,397 @@ def get_bubble(audio: np.ndarray, start: int, size: int, fs: int = 48000) -> tup
     return (bubble, bubble_time)
 
 
-def get_peaks(audio: np.ndarray, size: int, max_value: int = 8000) -> list:
+def get_peaks(audio: np.ndarray, size: int, max_value: int = 8000) -> np.ndarray:
     """Determine the amplitude values that are higher than a given value,
     which will be taken as maximum amplitude values in the audio.
 
+    The signal is split into consecutive blocks of `size` samples (the last
+    one may be shorter) and the position of the maximum of every block is
+    found in a single pass.
+
     Args:
         audio (np.ndarray): Acoustic signal in which the maximum values will be found.
         size (int): Size of the bubble.
         max_value (int, optional): The value taken as a threshold. Defaults to 8000.
 
     Returns:
-        list: All the maximum values found.
+        np.ndarray: Positions (int64) of the maximum values found.
+    """
+
+    audio = np.asarray(audio)
+    n_full = len(audio) // size
+    blocks = audio[:n_full * size].reshape(n_full, size)
+
+    positions = np.argmax(blocks, axis=1)
+    values = blocks[np.arange(n_full), positions]
+    max_pos = positions + np.arange(0, n_full * size, size)
+
+    # THE LAST BLOCK IS SHORTER WHEN THE LENGTH IS NOT A MULTIPLE OF SIZE
+    if n_full * size < len(audio):
+        tail = audio[n_full * size:]
+        position = np.argmax(tail)
+        values = np.append(values, tail[position])
+        max_pos = np.append(max_pos, position + n_full * size)
+
+    return max_pos[values > max_value].astype(np.int64)
+
+
+def get_spectra(audio: np.ndarray, starts: np.ndarray, size: int, fs: int = 48000) -> tuple:
+    """Compute the spectrum of every bubble at once, from their starts and duration.
+    The bubbles are selected with `get_windows` and a single real FFT is run
+    along the last axis.
+
+    Args:
+        audio (np.ndarray): Acoustic signal from where the bubbles will be obtained.
+        starts (np.ndarray): Points where the bubbles begin.
+        size (int): Size of the bubble.
+        fs (int, optional): Sampling frequency. Defaults to 48000.
+
+    Returns:
+        tuple: Peak frequency and peak magnitude of each bubble, the magnitude
+               matrix (one row per bubble) and the frequency axis.
+    """
+
+    windows = get_windows(audio, starts, size)
+
+    return get_windows_spectra(windows, fs)
+
+
+def get_windows(audio: np.ndarray, starts: np.ndarray, size: int) -> np.ndarray:
+    """Select every bubble of the audio at once, from their starts and duration.
+    The bubbles are taken as rows of a strided view over the signal, and the
+    ones that run past the end of the signal are padded with zeros.
+
+    Args:
+        audio (np.ndarray): Acoustic signal from where the bubbles will be obtained.
+        starts (np.ndarray): Points where the bubbles begin.
+        size (int): Size of the bubble.
+
+    Returns:
+        np.ndarray: Signals of the bubbles, with shape (n_bubbles, size).
+    """
+
+    audio = np.asarray(audio)
+    starts = np.asarray(starts, dtype=np.int64)
+
+    overflow = starts.max(initial=0) + size - len(audio)
+    if overflow > 0:
+        audio = np.concatenate((audio, np.zeros(overflow, dtype=audio.dtype)))
+
+    return np.lib.stride_tricks.sliding_window_view(audio, size)[starts]
+
+
+def get_windows_spectra(windows: np.ndarray, fs: int = 48000) -> tuple:
+    """Compute the spectrum of bubbles already selected, one bubble per row.
+
+    Args:
+        windows (np.ndarray): Signals of the bubbles, with shape (n_bubbles, size).
+        fs (int, optional): Sampling frequency. Defaults to 48000.
+
+    Returns:
+        tuple: Peak frequency and peak magnitude of each bubble, the magnitude
+               matrix (one row per bubble) and the frequency axis.
+    """
+
+    size = windows.shape[-1]
+    spectra = np.abs(np.fft.rfft(windows, axis=-1)) * (2 / size)
+    f_axis = np.fft.rfftfreq(size, 1 / fs)
+
+    positions = np.argmax(spectra, axis=-1)
+    peak_freqs = f_axis[positions]
+    peak_mags = spectra[np.arange(len(windows)), positions]
+
+    return (peak_freqs, peak_mags, spectra, f_axis)
+
+
+def get_decay(audio: np.ndarray, starts: np.ndarray, size: int, fs: int = 48000,
+              t_max: int = 2800, lmda_min: float = 0.01, lmda_max: float = 1,
+              lmda_length: int = 1000, points: int = 16, max_bytes: int = 64 * 2**20) -> tuple:
+    """Estimate the decay factor of every bubble at once. From the maximum of each
+    bubble up to `t_max`, the signal is compared with the model of `create_signal`
+    over the grid lmda_min + i * (lmda_max - lmda_min) / lmda_length, and the
+    value with the lowest quadratic error is taken as the effective lambda.
+
+    The grid is searched from coarse to fine, evaluating `points` values (at least 3)
+    per bubble and step, and the next step searches between the neighbours of the
+    best value. With `points` equal to `lmda_length` the whole grid is evaluated.
+
+    Args:
+        audio (np.ndarray): Acoustic signal from where the bubbles will be obtained.
+        starts (np.ndarray): Points where the bubbles begin.
+        size (int): Size of the bubble.
+        fs (int, optional): Sampling frequency. Defaults to 48000.
+        t_max (int, optional): Last sample of the bubble used in the fit. Defaults to 2800.
+        lmda_min (float, optional): First value of the grid. Defaults to 0.01.
+        lmda_max (float, optional): Upper limit of the grid. Defaults to 1.
+        lmda_length (int, optional): Number of values of the grid. Defaults to 1000.
+        points (int, optional): Values evaluated per bubble and step. Defaults to 16.
+        max_bytes (int, optional): Memory of each grid (bubbles, points, samples) evaluated
+                                   at once, it sets the number of bubbles. Defaults to 64 MiB.
+
+    Returns:
+        tuple: Effective lambda, frequency and quadratic error of each bubble.
+    """
+
+    windows = get_windows(audio, starts, size)
+    freqs, _, _, _ = get_windows_spectra(windows, fs)
+    n_bubbles = len(windows)
+
+    # THE REAL SIGNALS, ALIGNED ON THEIR MAXIMUM
+    t_min = np.argmax(windows, axis=1)
+    amp_max = windows[np.arange(n_bubbles), t_min]
+    length = max(min(t_max, size) - t_min.min(initial=t_max), 0)
+    samples = t_min[:, np.newaxis] + np.arange(length)
+    valid = samples < min(t_max, size)
+    real_signals = np.take_along_axis(windows, np.minimum(samples, size - 1), axis=1) * valid
+    t = np.arange(length) / fs
+    cosines = amp_max[:, np.newaxis] * np.cos(2 * np.pi * freqs[:, np.newaxis] * t)
+
+    delta_lmda = (lmda_max - lmda_min) / lmda_length
+    low = np.zeros(n_bubbles, dtype=np.int64)
+    high = np.full(n_bubbles, lmda_length - 1)
+    rows = np.arange(n_bubbles)
+    points = max(points, 3)
+
+    # BUBBLES EVALUATED AT ONCE, SO EACH GRID (BUBBLES, POINTS, SAMPLES) FITS IN max_bytes
+    chunk = max(max_bytes // (points * max(length, 1) * np.dtype(np.float64).itemsize), 1)
+
+    while True:
+        stride = np.maximum(-(-(high - low) // (points - 1)), 1)
+        candidates = np.minimum(low[:, np.newaxis] + stride[:, np.newaxis] * np.arange(points),
+                                high[:, np.newaxis])
+        lmdas = lmda_min + candidates * delta_lmda
+
+        # QUADRATIC ERROR FOR EVERY BUBBLE AND CANDIDATE
+        q_error = np.empty(candidates.shape)
+        for i in range(0, n_bubbles, chunk):
+            part = slice(i, i + chunk)
+            decay = np.exp(-np.pi * (lmdas[part] * freqs[part, np.newaxis])[..., np.newaxis] * t)
+            ideal = cosines[part, np.newaxis] * decay
+            q_diff = np.square(real_signals[part, np.newaxis] - ideal) * valid[part, np.newaxis]
+            q_error[part] = np.sum(q_diff, axis=-1)
+
+        best = np.argmin(q_error, axis=1)
+        index = candidates[rows, best]
+        residuals = q_error[rows, best]
+
+        if np.all(stride == 1):
+            break
+
+        # THE NEIGHBOURS OF THE BEST VALUE WERE EVALUATED, THE RANGE IS BETWEEN THEM
+        width = high - low
+        low = np.maximum(index - stride + 1, 0)
+        high = np.minimum(index + stride - 1, lmda_length - 1)
+        if np.all(high - low >= width):
+            break
+
+    return (lmda_min + index * delta_lmda, freqs, residuals)
+
+
+def iter_blocks(audio: np.ndarray, block_size: int):
+    """Walk over an acoustic signal in consecutive blocks of a fixed size.
+    Used together with `wavfile.read(path, mmap=True)`, only the block
+    being processed is loaded in memory.
+
+    Args:
+        audio (np.ndarray): Acoustic signal, it can be a memory-mapped array.
+        block_size (int): Number of samples of each block.
+
+    Yields:
+        tuple: Position of the first sample of the block and the block.
+    """
+
+    for offset in range(0, len(audio), block_size):
+        yield (offset, audio[offset:offset + block_size])
+
+
+def read_stream(source, block_size: int, dtype: str = 'int16', follow: bool = False,
+                poll: float = 0.1):
+    """Read raw audio samples from a binary stream (stdin, a FIFO or a file) in blocks.
+    A block can be shorter than `block_size` when fewer samples are available.
+
+    Args:
+        source (file): Binary file object from where the samples are read.
+        block_size (int): Maximum number of samples of each block.
+        dtype (str, optional): Type of the samples. Defaults to 'int16'.
+        follow (bool, optional): Keep waiting for new samples at the end of the
+                                 stream, as for a file being appended to. Defaults to False.
+        poll (float, optional): Seconds to wait before reading again when following
+                                the stream. Defaults to 0.1.
+
+    Yields:
+        tuple: Position of the first sample of the block and the block.
+    """
+
+    itemsize = np.dtype(dtype).itemsize
+    pending = b''
+    offset = 0
+
+    while True:
+        data = source.read(block_size * itemsize - len(pending))
+        if not data:
+            if follow:
+                sleep(poll)
+                continue
+            break
+
+        pending += data
+        n_bytes = len(pending) // itemsize * itemsize
+        if n_bytes:
+            block = np.frombuffer(pending[:n_bytes], dtype=dtype)
+            pending = pending[n_bytes:]
+            yield (offset, block)
+            offset += len(block)
+
+
+def filter_blocks(blocks, sos: np.ndarray):
+    """Filter a signal given in blocks, carrying the state of the filter
+    from one block to the next, so the result is the same as filtering
+    the whole signal at once with `signal.sosfilt`. The blocks with several
+    channels (samples, channels) are filtered channel by channel.
+
+    Args:
+        blocks (iterable): Pairs (offset, block) as given by `iter_blocks`.
+        sos (np.ndarray): Second-order sections of the filter.
+
+    Yields:
+        tuple: Position of the first sample of the block and the filtered block.
+    """
+
+    zi = None
+    for offset, block in blocks:
+        if zi is None:
+            zi = np.zeros((sos.shape[0], 2) + block.shape[1:])
+        filtered, zi = signal.sosfilt(sos, block, axis=0, zi=zi)
+        yield (offset, filtered)
+
+
+def stream_peaks(blocks, size: int, max_value: int = 8000):
+    """Determine the maximum amplitude values of a signal given in blocks.
+    The signal is split in chunks of `size` samples counted from its beginning,
+    as in `get_peaks`, no matter the size of the blocks.
+
+    Args:
+        blocks (iterable): Pairs (offset, block) as given by `iter_blocks`.
+        size (int): Size of the bubble.
+        max_value (int, optional): The value taken as a threshold. Defaults to 8000.
+
+    Yields:
+        np.ndarray: Positions of the maximum values found in each block.
     """
 
-    max_pos = []
-    for i in range(0, len(audio), size):
-        chunk = audio[i:i+size]
-        m = chunk.max()
-        if m > max_value:
-            max_pos.append(audio.tolist().index(m))
-    return max_pos
+    rest = np.zeros(0)
+    rest_offset = 0
+    for offset, block in blocks:
+        if len(rest):
+            block = np.concatenate((rest, block))
+            offset = rest_offset
+
+        n_samples = len(block) // size * size
+        yield get_peaks(block[:n_samples], size, max_value) + offset
+
+        rest = block[n_samples:]
+        rest_offset = offset + n_samples
+
+    if len(rest):
+        yield get_peaks(rest, size, max_value) + rest_offset
+
+
+def stream_bubbles(blocks, starts: np.ndarray, size: int):
+    """Select the bubbles of a signal given in blocks, from their starts and
+    duration. Only the samples still needed by the pending bubbles are kept,
+    so a bubble can start in one block and finish in the following ones.
+
+    Args:
+        blocks (iterable): Pairs (offset, block) as given by `iter_blocks`.
+        starts (np.ndarray): Points where the bubbles begin, in ascending order.
+        size (int): Size of the bubble.
+
+    Yields:
+        tuple: Start of the bubble and its signal. The bubbles that reach the
+               end of the signal are shorter than `size`.
+    """
+
+    starts = np.asarray(starts, dtype=np.int64)
+    buffer = np.zeros(0)
+    buffer_offset = 0
+    k = 0
+
+    for offset, block in blocks:
+        if len(buffer):
+            buffer = np.concatenate((buffer, block))
+        else:
+            buffer, buffer_offset = block, offset
+        end = buffer_offset + len(buffer)
+
+        while k < len(starts) and starts[k] + size <= end:
+            begin = max(starts[k] - buffer_offset, 0)
+            yield (starts[k], buffer[begin:begin + size])
+            k += 1
+
+        # DROP THE SAMPLES THAT NO PENDING BUBBLE NEEDS
+        keep = starts[k] if k < len(starts) else end
+        cut = min(max(keep - buffer_offset, 0), len(buffer))
+        buffer = buffer[cut:]
+        buffer_offset += cut
+
+    for start in starts[k:]:
+        begin = max(start - buffer_offset, 0)
+        yield (start, buffer[begin:begin + size])
+
+
+def detect_bubbles(blocks, size: int, max_value: int = 8000):
+    """Find the bubbles of a signal given in blocks, as `get_peaks` followed by
+    `get_bubble` would do over the whole signal. Each bubble is given as soon
+    as its `size` samples have been received.
+
+    Args:
+        blocks (iterable): Pairs (offset, block) as given by `iter_blocks`.
+        size (int): Size of the bubble.
+        max_value (int, optional): The value taken as a threshold. Defaults to 8000.
+
+    Yields:
+        tuple: Start of the bubble and its signal. The bubbles that reach the
+               end of the signal are shorter than `size`.
+    """
+
+    buffer = np.zeros(0)
+    buffer_offset = 0
+    scanned = 0
+    pending = np.zeros(0, dtype=np.int64)
+
+    for offset, block in blocks:
+        if len(buffer):
+            buffer = np.concatenate((buffer, block))
+        else:
+            buffer, buffer_offset = block, offset
+        end = buffer_offset + len(buffer)
+
+        # LOOKING FOR PEAKS IN THE CHUNKS COMPLETED BY THIS BLOCK
+        n_samples = (end - scanned) // size * size
+        if n_samples:
+            begin = scanned - buffer_offset
+            peaks = get_peaks(buffer[begin:begin + n_samples], size, max_value) + scanned
+            pending = np.append(pending, peaks)
+            scanned += n_samples
+
+        ready = pending + size <= end
+        for start in pending[ready]:
+            yield (start, buffer[start - buffer_offset:start - buffer_offset + size])
+        pending = pending[~ready]
+
+        # DROP THE SAMPLES THAT ARE NOT NEEDED ANYMORE
+        keep = min(scanned, pending[0]) if len(pending) else scanned
+        cut = min(max(keep - buffer_offset, 0), len(buffer))
+        buffer = buffer[cut:]
+        buffer_offset += cut
+
+    if scanned < buffer_offset + len(buffer):
+        peaks = get_peaks(buffer[scanned - buffer_offset:], size, max_value) + scanned
+        pending = np.append(pending, peaks)
+
+    for start in pending:
+        yield (start, buffer[start - buffer_offset:start - buffer_offset + size])
 
 
 def get_radius(frequency: int) -> float:
@@ -221,8 +588,78 @@ def plot_spectrogram(audio: np.ndarray, fs: int, diameter: int, *args):
     # cbar.set_ticks([])
 
 
-def videogram(audio: np.ndarray, audio_filt: np.ndarray, fs: int, fps: int = 30, btr: int = 3500):
+def render_frames(background: np.ndarray, cursors: list, frames: range, output):
+    """Write the frames of the animated spectrogram as raw RGB bytes. The cursor
+    is drawn over the background, the frame is written and the background is
+    restored, so no frame is redrawn by matplotlib.
+
+    Args:
+        background (np.ndarray): Static image (height, width, 3) of the signal and spectrogram.
+        cursors (list): For each axes, the column of the cursor in every frame
+                        (-1 when it is outside the axes) and the first and last rows.
+        frames (range): Numbers of the frames to be written.
+        output (file): Binary file object where the frames are written, e.g. the stdin of FFmpeg.
+    """
+
+    for k in frames:
+        saved = []
+        for columns, top, bottom in cursors:
+            column = columns[k]
+            if column >= 0:
+                saved.append((column, top, bottom, background[top:bottom, column:column + 2].copy()))
+                background[top:bottom, column:column + 2] = 0
+
+        output.write(background.tobytes())
+
+        for column, top, bottom, pixels in saved:
+            background[top:bottom, column:column + 2] = pixels
+
+
+def _ffmpeg_raw_input(width: int, height: int, fps: int) -> list:
+    """Arguments of FFmpeg to read raw RGB frames from its stdin."""
+
+    return ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-f', 'rawvideo',
+            '-pix_fmt', 'rgb24', '-s', '{}x{}'.format(width, height), '-r', str(fps), '-i', '-']
+
+
+def _encode_frames(command: list, background: np.ndarray, cursors: list, frames):
+    """Pipe the frames of the animated spectrogram to FFmpeg. When FFmpeg fails, also
+    when it exits before reading all the frames, its error message is raised."""
+
+    with subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE) as ffmpeg:
+        try:
+            render_frames(background, cursors, frames, ffmpeg.stdin)
+            ffmpeg.stdin.close()
+        except BrokenPipeError:
+            # FFmpeg exited early, the reason is in its error message
+            try:
+                ffmpeg.stdin.close()
+            except BrokenPipeError:
+                pass
+        stderr = ffmpeg.stderr.read()
+        if ffmpeg.wait():
+            message = stderr.decode(errors='replace').strip()
+            raise RuntimeError('FFmpeg exited with status {}: {}'.format(
+                ffmpeg.returncode, message or 'no message')) from \
+                subprocess.CalledProcessError(ffmpeg.returncode, command, stderr=stderr)
+
+
+def _render_segment(background: np.ndarray, cursors: list, frames: range, fps: int, btr: int,
+                    path: str):
+    """Encode a range of frames of the animated spectrogram in a video file, without audio."""
+
+    height, width, _ = background.shape
+    command = _ffmpeg_raw_input(width, height, fps) + [
+        '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-b:v', '{}k'.format(btr), path]
+
+    _encode_frames(command, background, cursors, frames)
+
+
+def videogram(audio: np.ndarray, audio_filt: np.ndarray, fs: int, fps: int = 30, btr: int = 3500,
+              output: str = 'specgram_animation.mp4', jobs: int = 1):
     """Create an animated spectrogram along with the acoustic signal using the FFmpeg command.
+    The signal and the spectrogram are drawn once, only the cursor is drawn on each frame
+    and the frames are piped to FFmpeg. The temporary files are kept in a temporary folder.
 
     Args:
         audio (ndarray): Original acoustic signal.
@@ -230,64 +667,95 @@ def videogram(audio: np.ndarray, audio_filt: np.ndarray, fs: int, fps: int = 30,
         fs (int): Sampling frequency.
         fps (int, optional): Number of frames per second to create the video. Defaults to 30.
         btr (int, optional): Bit rate to create the video. Defaults to 3500.
+        output (str, optional): Path of the video. Defaults to 'specgram_animation.mp4'.
+        jobs (int, optional): Number of processes encoding ranges of frames in parallel.
+                              Defaults to 1.
     """
 
-    # Saving the audio file
-    wavfile.write("cutted.wav", fs, audio)
-    FFMpegWriter = animation.writers['ffmpeg']
-    writer = FFMpegWriter(fps=fps, bitrate=btr, metadata=dict(
-        title='Spectrogram Animation', artist='adejonghm', comment='LACMAM/POLI-USP'))
-
     duration = len(audio_filt) / fs
     freqs = np.fft.fftfreq(audio_filt.shape[0], 1/fs) / 1000
     max_freq_kHz = freqs.max()
     times = np.arange(audio_filt.shape[0]) / float(fs)
 
-    fig = plt.figure(figsize=(10, 5))
+    fig = plt.figure(figsize=(10, 5), dpi=100)
+    canvas = FigureCanvasAgg(fig)
 
-    plt.subplot(2, 1, 1)
+    ax1 = plt.subplot(2, 1, 1)
     plt.plot(times, (audio_filt).astype(float) /
              np.max(np.abs(audio_filt)), lw=0.1)
 
     plt.xlim(0, duration)
     plt.ylim(-1, 1)
 
-    l1, = plt.plot([], [], color='k')
-
-    plt.subplot(2, 1, 2)
+    ax2 = plt.subplot(2, 1, 2)
     plt.specgram(audio_filt, Fs=fs, cmap=plt.get_cmap('jet'))
     plt.xlim(0, duration)
     plt.ylim(0, max_freq_kHz*500.0)
     plt.xlabel('Time (s)')
     plt.ylabel('Frequency (Hz)')
     formatter = FuncFormatter(lambda x, y: '%1.fk' % (x*1e-3))
-    ax = plt.gca()
-    ax.yaxis.set_major_formatter(formatter)
-
-    l2, = plt.plot([], [], color='k')
+    ax2.yaxis.set_major_formatter(formatter)
 
     plt.tight_layout()
     plt.subplots_adjust(bottom=0.09, right=0.98,
                         top=0.98, left=0.08, hspace=0.14)
 
-    x = np.array([0., 0.])
-    y0 = np.array([-1, 1])
-    y1 = np.array([0, max_freq_kHz*1000.0])
+    # STATIC IMAGE, WITH EVEN DIMENSIONS AS REQUIRED BY THE ENCODER
+    canvas.draw()
+    background = np.asarray(canvas.buffer_rgba())[..., :3]
+    height, width = background.shape[0] // 2 * 2, background.shape[1] // 2 * 2
+    background = np.ascontiguousarray(background[:height, :width])
+
+    # COLUMNS OF THE CURSOR IN EACH FRAME, FOR EACH AXES
+    n_frames = (int(duration)+1)*fps
+    x = np.arange(1, n_frames + 1) / float(fps)
+    cursors = []
+    for ax in (ax1, ax2):
+        bbox = ax.get_window_extent()
+        columns = ax.transData.transform(np.column_stack((x, np.zeros_like(x))))[:, 0]
+        columns = np.where((columns >= bbox.x0) & (columns <= bbox.x1 - 2), columns, -1).astype(int)
+        top, bottom = max(int(fig.bbox.height - bbox.y1), 0), min(int(fig.bbox.height - bbox.y0), height)
+        cursors.append((columns, top, bottom))
+    plt.close(fig)
 
     # plt.savefig('spectrogram.jpg')
 
-    with writer.saving(fig, "temp.mp4", 100):
-        for _ in tqdm(range((int(duration)+1)*fps), desc="Creating video"):
-            x += 1.0/float(fps)
-            l1.set_data(x, y0)
-            l2.set_data(x, y1)
-            writer.grab_frame()
+    metadata = ['-metadata', 'title=Spectrogram Animation', '-metadata', 'artist=adejonghm',
+                '-metadata', 'comment=LACMAM/POLI-USP']
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Saving the audio file
+        audio_path = os.path.join(temp_dir, 'cutted.wav')
+        wavfile.write(audio_path, fs, audio)
+
+        if jobs <= 1:
+            command = _ffmpeg_raw_input(width, height, fps) + [
+                '-i', audio_path, '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-b:v', '{}k'.format(btr),
+                '-c:a', 'aac'] + metadata + [output]
 
-    os.system(
-        "ffmpeg -y -i cutted.wav -i temp.mp4 -hide_banner -c:v copy -strict -2 specgram_animation.mp4")
-    clear()
-    os.system("rm temp.mp4")
-    os.system("rm cutted.wav")
+            _encode_frames(command, background, cursors,
+                           tqdm(range(n_frames), desc="Creating video"))
+
+        else:
+            # RENDERING RANGES OF FRAMES IN PARALLEL AND JOINING THEM
+            bounds = np.linspace(0, n_frames, jobs + 1).astype(int)
+            segments = [os.path.join(temp_dir, 'segment_{}.mp4'.format(i)) for i in range(jobs)]
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(_render_segment, background, cursors,
+                                           range(bounds[i], bounds[i + 1]), fps, btr, segments[i])
+                           for i in range(jobs) if bounds[i] < bounds[i + 1]]
+                for future in tqdm(futures, desc="Creating video"):
+                    future.result()
+
+            list_path = os.path.join(temp_dir, 'segments.txt')
+            with open(list_path, 'w', encoding='utf-8') as file:
+                for i, path in enumerate(segments):
+                    if bounds[i] < bounds[i + 1]:
+                        file.write("file '{}'\n".format(path))
+
+            subprocess.run(['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-f', 'concat',
+                            '-safe', '0', '-i', list_path, '-i', audio_path, '-c:v', 'copy',
+                            '-c:a', 'aac'] + metadata + [output], check=True)
 
 
 def create_signal(freq: int, deltha: float, time: np.ndarray, amplitude: float = 1) -> np.ndarray:
@@ -307,6 +775,44 @@ def create_signal(freq: int, deltha: float, time: np.ndarray, amplitude: float =
     return amplitude * np.cos(omega * time) * np.exp(-np.pi * deltha * freq * time)
 
 
+def create_signals(freqs: np.ndarray, delthas: np.ndarray, time: np.ndarray,
+                   amplitudes: np.ndarray = 1) -> np.ndarray:
+    """Create several audio signals at once, one signal per row.
+
+    Args:
+        freqs (np.ndarray): Frequencies used to create the signals.
+        delthas (np.ndarray): The decay factors of the signals.
+        time (np.ndarray): Time vector.
+        amplitudes (np.ndarray, optional): Amplitudes of the signals. Defaults to 1.
+
+    Returns:
+        np.ndarray: The acoustic signals, with shape (n_signals, len(time)).
+    """
+
+    return create_signal(np.reshape(freqs, (-1, 1)), np.reshape(delthas, (-1, 1)),
+                         time, np.reshape(amplitudes, (-1, 1)))
+
+
+def add_signals(audio: np.ndarray, signals: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Add several signals into an audio signal in a single operation. The signals
+    can overlap each other and the samples past the end of the audio are dropped.
+
+    Args:
+        audio (np.ndarray): Audio signal where the signals are added, in place.
+        signals (np.ndarray): Signals to be added, one signal per row.
+        starts (np.ndarray): Positions where the signals begin.
+
+    Returns:
+        np.ndarray: The audio signal with the signals added.
+    """
+
+    positions = np.reshape(starts, (-1, 1)) + np.arange(signals.shape[1])
+    inside = positions < len(audio)
+    audio += np.bincount(positions[inside], weights=signals[inside], minlength=len(audio))
+
+    return audio
+
+
 def frequency_classifier(freqs: list) -> tuple:
     """Classify frequencies by scenario.
 
@@ -329,12 +835,14 @@ def frequency_classifier(freqs: list) -> tuple:
     return (c1, c2, c3)
 
 
-def create_random_stage(source: dict, n: int) -> list:
+def create_random_stage(source: dict, n: int, rng: np.random.Generator = None) -> list:
     """Create a random sub-stage with N elements from an initial set.
 
     Args:
         source (dict): Original set of elements.
         n (int): Number of elements to be selected.
+        rng (np.random.Generator, optional): Generator used to select the elements.
+                                             Defaults to None, using np.random.
 
     Returns:
         list: Stage with the elements selected according to
@@ -342,7 +850,10 @@ def create_random_stage(source: dict, n: int) -> list:
     """
 
     stage_elements = []
-    positions = np.random.randint(0, len(source['frequencies']), size=n)
+    if rng is None:
+        positions = np.random.randint(0, len(source['frequencies']), size=n)
+    else:
+        positions = rng.integers(0, len(source['frequencies']), size=n)
 
     for elements in source.values():
         if isinstance(elements, list):
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+"""
+Dev: 	adejonghm
+----------
+
+Tracking of the bubbles across the frames of a node. The objects found in each
+frame are linked to the trajectories of the previous frames by the distance of
+their centroids to the predicted position of each trajectory, or by the overlap
+of their bounding boxes, closest pairs first. Each frame only compares its few
+objects with the few trajectories alive, so a sequence is tracked in linear time.
+
+The trajectories are given as flat arrays, one row per object, grouped by
+bubble with offsets, together with the velocities of the centroids and the
+frames where each bubble starts and ends. The trajectories that are too short
+or too small, as the ones of the noise of the segmentation, are left out.
+
+Example:
+  tracker = BubbleTracker(max_distance=20)
+  for frame, analysis in ...:
+      tracker.update(frame, centroids, bboxes, areas)
+  tracks = tracker.tracks(fps)
+"""
+
+# Third party imports
+import numpy as np
+
+
+TRACKS_FILE = 'tracks.npz'
+
+
+class BubbleTracker:
+    """Link the objects of consecutive frames into trajectories.
+
+    Args:
+        max_distance (float, optional): Maximum distance in pixels between the predicted
+                                         centroid of a trajectory and an object. Defaults to 20.
+        max_gap (int, optional): Frames a trajectory is kept without objects. Defaults to 2.
+        min_frames (int, optional): Objects of the shortest trajectory kept. Defaults to 3.
+        min_area (float, optional): Mean area in pixels of the smallest trajectory kept.
+                                    Defaults to 10.
+    """
+
+    def __init__(self, max_distance: float = 20, max_gap: int = 2, min_frames: int = 3,
+                 min_area: float = 10):
+
+        self.max_distance = max_distance
+        self.max_gap = max_gap
+        self.min_frames = min_frames
+        self.min_area = min_area
+        self.active = {}
+        self.next_id = 1
+        self.ids = []
+        self.frames = []
+        self.centroids = []
+        self.areas = []
+
+    def update(self, frame: int, centroids: np.ndarray, bboxes: np.ndarray,
+               areas: np.ndarray) -> np.ndarray:
+        """Link the objects of a frame to the trajectories, or start new ones.
+
+        Args:
+            frame (int): Index of the frame, increasing from one call to the next.
+            centroids (np.ndarray): Centroid (x, y) of each object.
+            bboxes (np.ndarray): Bounding box (y_min, y_max, x_min, x_max) of each object.
+            areas (np.ndarray): Number of pixels of each object.
+
+        Returns:
+            np.ndarray: Number of the bubble of each object.
+        """
+
+        centroids = np.reshape(np.asarray(centroids, dtype=np.float64), (-1, 2))
+        bboxes = np.reshape(np.asarray(bboxes), (-1, 4))
+        ids = np.zeros(len(centroids), dtype=np.int64)
+
+        # TRAJECTORIES WITHOUT OBJECTS FOR TOO LONG ARE FINISHED
+        self.active = {k: track for k, track in self.active.items()
+                       if frame - track['frame'] <= self.max_gap}
+        keys = list(self.active)
+
+        if keys and len(centroids):
+            # PREDICTED CENTROIDS AND BOXES, MOVED AT THE LAST VELOCITY
+            steps = np.array([frame - self.active[k]['frame'] for k in keys])[:, np.newaxis]
+            moves = np.array([self.active[k]['velocity'] for k in keys]) * steps
+            predicted = np.array([self.active[k]['centroid'] for k in keys]) + moves
+            boxes = np.array([self.active[k]['bbox'] for k in keys]) + \
+                np.round(moves[:, [1, 1, 0, 0]]).astype(np.int64)
+
+            distances = np.linalg.norm(predicted[:, np.newaxis] - centroids[np.newaxis], axis=-1)
+            overlap = (boxes[:, np.newaxis, 0] < bboxes[np.newaxis, :, 1]) & \
+                      (bboxes[np.newaxis, :, 0] < boxes[:, np.newaxis, 1]) & \
+                      (boxes[:, np.newaxis, 2] < bboxes[np.newaxis, :, 3]) & \
+                      (bboxes[np.newaxis, :, 2] < boxes[:, np.newaxis, 3])
+            allowed = (distances <= self.max_distance) | overlap
+
+            # CLOSEST PAIRS FIRST, EACH TRAJECTORY AND EACH OBJECT USED ONCE
+            linked = set()
+            for flat in np.argsort(distances, axis=None, kind='stable'):
+                (t, d) = divmod(int(flat), len(centroids))
+                if allowed[t, d] and keys[t] not in linked and not ids[d]:
+                    ids[d] = keys[t]
+                    linked.add(keys[t])
+
+        for d in np.flatnonzero(ids == 0):
+            ids[d] = self.next_id
+            self.next_id += 1
+
+        for d, k in enumerate(ids.tolist()):
+            velocity = np.zeros(2)
+            if k in self.active:
+                track = self.active[k]
+                velocity = (centroids[d] - track['centroid']) / (frame - track['frame'])
+            self.active[k] = {'frame': frame, 'centroid': centroids[d], 'velocity': velocity,
+                              'bbox': bboxes[d]}
+
+        self.ids.extend(ids.tolist())
+        self.frames.extend([frame] * len(ids))
+        self.centroids.extend(centroids.tolist())
+        self.areas.extend(np.asarray(areas).tolist())
+
+        return ids
+
+    def tracks(self, fps: float = None) -> dict:
+        """Trajectories found so far, see `get_tracks`."""
+
+        return get_tracks(self.ids, self.frames, self.centroids, self.areas, fps,
+                          self.min_frames, self.min_area)
+
+
+def get_tracks(ids, frames, centroids, areas, fps: float = None, min_frames: int = 1,
+               min_area: float = 0) -> dict:
+    """Group the objects by bubble, in the order of the frames, and find the velocity
+    of the centroid in each frame and the rise velocity of each bubble. The bubbles
+    with less than `min_frames` objects or a mean area under `min_area` are left out.
+
+    Args:
+        ids (array_like): Number of the bubble of each object.
+        frames (array_like): Index of the frame of each object.
+        centroids (array_like): Centroid (x, y) of each object.
+        areas (array_like): Number of pixels of each object.
+        fps (float, optional): Frames per second. Defaults to None, the velocities are
+                               then in pixels per frame instead of pixels per second.
+        min_frames (int, optional): Objects of the shortest bubble kept. Defaults to 1.
+        min_area (float, optional): Mean area in pixels of the smallest bubble kept.
+                                    Defaults to 0.
+
+    Returns:
+        dict: Arrays of the trajectories. 'ids', 'spans' (first and last frame), 'offsets'
+              and 'rise_velocities' have one row per bubble (the offsets one more), and
+              'frames', 'centroids', 'areas' and 'velocities' one row per object, the
+              objects of the i-th bubble being the rows offsets[i]:offsets[i+1].
+              'fps' (NaN when unknown) and 'units' give the units of the velocities.
+    """
+
+    ids = np.asarray(ids, dtype=np.int64)
+    frames = np.asarray(frames, dtype=np.int64)
+    centroids = np.reshape(np.asarray(centroids, dtype=np.float64), (-1, 2))
+    areas = np.asarray(areas, dtype=np.int64)
+
+    # BUBBLES TOO SHORT OR TOO SMALL, AS THE NOISE OF THE SEGMENTATION, ARE LEFT OUT
+    (_, inverse, counts) = np.unique(ids, return_inverse=True, return_counts=True)
+    mean_areas = np.bincount(inverse, weights=areas, minlength=len(counts)) / np.maximum(counts, 1)
+    keep = ((counts >= min_frames) & (mean_areas >= min_area))[inverse]
+    (ids, frames, centroids, areas) = (ids[keep], frames[keep], centroids[keep], areas[keep])
+
+    order = np.lexsort((frames, ids))
+    (ids, frames, centroids, areas) = (ids[order], frames[order], centroids[order], areas[order])
+    (bubbles, starts) = np.unique(ids, return_index=True)
+    offsets = np.append(starts, len(ids))
+    times = frames / (fps or 1)
+
+    # VELOCITY OF EACH OBJECT: MEAN OF THE DIFFERENCES WITH THE PREVIOUS AND NEXT ONES
+    same = (ids[1:] == ids[:-1])[:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        steps = np.where(same, np.diff(centroids, axis=0) / np.diff(times)[:, np.newaxis], 0)
+    velocities = np.zeros_like(centroids)
+    counts = np.zeros((len(ids), 1))
+    velocities[:-1] += steps
+    velocities[1:] += steps
+    counts[:-1] += same
+    counts[1:] += same
+    velocities /= np.maximum(counts, 1)
+
+    # RISE VELOCITY: UPWARD DISPLACEMENT FROM THE FIRST TO THE LAST FRAME
+    (first, last) = (offsets[:-1], offsets[1:] - 1)
+    durations = times[last] - times[first]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rise = np.where(durations > 0,
+                        (centroids[first, 1] - centroids[last, 1]) / durations, 0)
+
+    return {
+        'ids': bubbles,
+        'spans': np.column_stack((frames[first], frames[last])).reshape(-1, 2),
+        'offsets': offsets,
+        'rise_velocities': rise,
+        'frames': frames,
+        'centroids': centroids,
+        'areas': areas,
+        'velocities': velocities,
+        'fps': np.float64(fps if fps else np.nan),
+        'units': np.array('px/s' if fps else 'px/frame')
+    }
+
+
+def save_tracks(path: str, tracks: dict):
+    """Save the trajectories made by `get_tracks` in a .npz file.
+
+    Args:
+        path (str): Path of the .npz file.
+        tracks (dict): Arrays of the trajectories.
+    """
+
+    np.savez(path, **tracks)
+
+
+def load_tracks(path: str) -> dict:
+    """Load the trajectories saved by `save_tracks`.
+
+    Args:
+        path (str): Path of the .npz file.
+
+    Returns:
+        dict: Arrays of the trajectories.
+    """
+
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""
+Dev: 	adejonghm
+----------
+
+Tests of the warm start of image_segmentation.py, on a synthetic node where
+the bubble moves more than the margin of the warm start in each frame.
+"""
+
+# Standard library imports
+import os
+import sys
+
+# Third party imports
+import cv2 as cv
+import numpy as np
+
+# Local application imports
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'ImageProcessing')]
+
+from dsip import improc as dip  # noqa: E402
+import image_segmentation as seg  # noqa: E402
+
+
+def make_node(rows: list, shape: tuple = (190, 320)) -> tuple:
+    """Background and frames of a bubble rising through the given rows."""
+
+    rng = np.random.default_rng(0)
+    backg = np.clip(rng.normal(60, 3, shape), 0, 255).astype(np.uint8)
+    frames = []
+    for y in rows:
+        mask = np.zeros(shape, np.uint8)
+        cv.ellipse(mask, (180, y), (20, 16), 0, 0, 360, 1, -1)
+        frame = backg.astype(int) + 100 * mask + rng.normal(0, 2, shape)
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+
+    return (backg, frames)
+
+
+def make_params(shape: tuple) -> tuple:
+    """Parameters of the segmentation, as in image_segmentation.py."""
+
+    (roi, roi_coord) = dip.get_roi([0, 190, 130, 230], shape, 10)
+    params = {
+        'crop': roi, 'roi': roi, 'roi_coord': roi_coord, 'img_shape': shape,
+        'sigma': 0.7, 'timestep': 2, 'mu': 0.1, 'lmda': 10, 'epsilon': 2.0, 'alpha': 2,
+        'c': 2, 'potential_function': 'double-well', 'iter_inner': 20, 'iter_outer': 30,
+        'iter_refine': 10, 'tolerance': 0, 'dtype': np.float64, 'band': 0, 'margin': 5,
+        'area_change': 0.2
+    }
+
+    return (roi, params)
+
+
+def test_warm_start_follows_a_bubble_faster_than_the_margin():
+    (backg, frames) = make_node([160, 148, 136, 124, 112, 100])
+    (roi, params) = make_params(backg.shape)
+    seg.init_worker(backg[roi], params)
+    crops = [np.ascontiguousarray(frame[roi]) for frame in frames]
+
+    expected = [seg.segment_frame(crop)[1] > 0 for crop in crops]
+
+    warm = {'phi': None, 'centroids': [], 'selected': 1}
+    for (i, (phi, bw_image, _)) in seg.segment_sequential(enumerate(crops), warm):
+        assert np.array_equal(bw_image > 0, expected[i]), 'frame {}'.format(i)
+        warm['phi'] = phi
+        warm['centroids'] = warm['centroids'][-1:] + [dip.get_centroid(bw_image)]
+
+
+def test_lost_by_warm_start():
+    previous = np.full((40, 40), 2.0)
+    previous[10:20, 10:20] = -2
+    start = np.zeros((40, 40), bool)
+    start[5:25, 5:25] = True
+
+    # INSIDE THE INITIAL REGION, WITH THE SAME AREA
+    assert not seg.lost_by_warm_start(previous, start, previous, 0.2)
+
+    # REACHING THE BORDER OF THE INITIAL REGION
+    phi = np.full((40, 40), 2.0)
+    phi[5:15, 10:20] = -2
+    assert seg.lost_by_warm_start(phi, start, previous, 0.2)
+
+    # SHRINKING MORE THAN THE ALLOWED FRACTION
+    phi = np.full((40, 40), 2.0)
+    phi[10:17, 10:20] = -2
+    assert seg.lost_by_warm_start(phi, start, previous, 0.2)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+"""
+Dev: 	adejonghm
+----------
+
+Tests of the tracking of the bubbles, on synthetic binary frames where one
+bubble rises and a noisy frame adds small spurious objects.
+"""
+
+# Standard library imports
+import os
+import sys
+
+# Third party imports
+import cv2 as cv
+import numpy as np
+
+# Local application imports
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dsip import improc as dip  # noqa: E402
+from dsip.tracking import BubbleTracker, get_tracks  # noqa: E402
+
+
+def make_frames(count: int, noisy: int, shape: tuple = (190, 320)) -> list:
+    """Binary frames of a bubble rising 9 px per frame, the frame `noisy` with noise."""
+
+    rng = np.random.default_rng(0)
+    frames = []
+    for f in range(count):
+        frame = np.zeros(shape, np.uint8)
+        cv.ellipse(frame, (160, 160 - 9 * f), (12, 9), 0, 0, 360, 255, -1)
+        if f == noisy:
+            ## ISOLATED PIXELS AND A SMALL BLOB AWAY FROM THE BUBBLE ##
+            frame[rng.integers(0, 40, 30), rng.integers(0, 100, 30)] = 255
+            frame[150:153, 260:263] = 255
+        frames.append(frame)
+
+    return frames
+
+
+def track(frames: list, **kwargs) -> dict:
+    tracker = BubbleTracker(**kwargs)
+    for f, frame in enumerate(frames):
+        analysis = dip.FrameAnalysis(frame)
+        (x, y, w, h) = analysis.bboxes.T
+        tracker.update(f, analysis.centroids, np.column_stack((y, y + h, x, x + w)),
+                       analysis.areas)
+
+    return tracker.tracks(30)
+
+
+def test_noise_of_a_frame_is_not_tracked():
+    frames = make_frames(10, noisy=4)
+    tracks = track(frames)
+
+    assert len(tracks['ids']) == 1
+    assert tracks['spans'].tolist() == [[0, 9]]
+    assert np.allclose(tracks['rise_velocities'], 9 * 30)
+    assert len(tracks['frames']) == 10
+    assert np.all(np.diff(tracks['offsets']) == 10)
+
+
+def test_all_tracks_kept_without_limits():
+    frames = make_frames(10, noisy=4)
+    tracks = track(frames, min_frames=1, min_area=0)
+
+    assert len(tracks['ids']) > 1
+    assert np.count_nonzero(tracks['rise_velocities'] == 0) == len(tracks['ids']) - 1
+
+
+def test_get_tracks_by_length_and_area():
+    ids = [1, 1, 1, 2, 3, 3, 3]
+    frames = [0, 1, 2, 1, 0, 1, 2]
+    centroids = [[0, 30], [0, 20], [0, 10], [5, 5], [9, 9], [9, 8], [9, 7]]
+    areas = [100, 100, 100, 100, 2, 3, 1]
+
+    assert get_tracks(ids, frames, centroids, areas)['ids'].tolist() == [1, 2, 3]
+    assert get_tracks(ids, frames, centroids, areas, min_frames=2)['ids'].tolist() == [1, 3]
+    tracks = get_tracks(ids, frames, centroids, areas, min_frames=2, min_area=10)
+    assert tracks['ids'].tolist() == [1]
+    assert tracks['offsets'].tolist() == [0, 3]
+    assert tracks['rise_velocities'].tolist() == [10]